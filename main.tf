@@ -1,3 +1,9 @@
+module "common_layer" {
+  source = "./modules/common_layer"
+
+  project_name = var.project_name
+}
+
 module "api_gateway" {
   source = "./modules/api_gateway"
 
@@ -9,6 +15,7 @@ module "slack_event_listener" {
   source = "./modules/slack_listener"
 
   project_name          = var.project_name
+  common_layer_arn      = module.common_layer.layer_arn
   artifacts_bucket_name = aws_s3_bucket.artifacts.id
   slack_api_token       = var.slack_api_token
   slack_signing_secret  = var.slack_signing_secret
@@ -23,6 +30,7 @@ module "ldap_query_lambda" {
   source = "./modules/ldap_query"
 
   project_name                  = var.project_name
+  common_layer_arn              = module.common_layer.layer_arn
   artifacts_bucket_name         = aws_s3_bucket.artifacts.id
   ldaps_url                     = var.ldaps_url
   domain_base_dn                = var.domain_base_dn
@@ -31,6 +39,12 @@ module "ldap_query_lambda" {
   svc_user_pwd_ssm_key          = var.svc_user_pwd_ssm_key
   vpc_id                        = var.vpc_id
   days_since_pwdlastset         = var.days_since_pwdlastset
+  search_page_size              = var.search_page_size
+  enable_incremental_scan       = var.enable_incremental_scan
+  modify_window                 = var.modify_window
+  search_bases                  = var.search_bases
+  scan_shards                   = var.scan_shards
+  report_thresholds             = var.report_thresholds
 
   log_level = var.log_level
 }
@@ -39,6 +53,7 @@ module "slack_notifier" {
   source = "./modules/slack_notifier"
 
   project_name          = var.project_name
+  common_layer_arn      = module.common_layer.layer_arn
   artifacts_bucket_name = aws_s3_bucket.artifacts.id
   slack_channel_id      = var.slack_channel_id
   slack_api_token       = var.slack_api_token
@@ -53,12 +68,14 @@ module "slack_bot" {
   source = "./modules/slack_bot"
 
   project_name                   = var.project_name
+  common_layer_arn               = module.common_layer.layer_arn
   step_function_arn              = aws_sfn_state_machine.ldap_maintenance.id
   target_api_gw_id               = module.api_gateway.rest_api_deployment.rest_api_id
   target_api_gw_root_resource_id = module.api_gateway.rest_api.root_resource_id
   slack_signing_secret           = var.slack_signing_secret
   slack_api_token                = var.slack_api_token
   artifacts_bucket_name          = aws_s3_bucket.artifacts.id
+  enable_deferred_commands       = var.enable_deferred_slack_commands
 
   log_level = var.log_level
 }
@@ -67,9 +84,11 @@ module "dynamodb_cleanup" {
   source = "./modules/dynamodb_cleanup"
 
   project_name          = var.project_name
+  common_layer_arn      = module.common_layer.layer_arn
   dynamodb_table_name   = var.dynamodb_table_name
   dynamodb_table_arn    = var.dynamodb_table_arn
   artifacts_bucket_name = aws_s3_bucket.artifacts.id
+  days_since_pwdlastset = var.days_since_pwdlastset
 
   log_level = var.log_level
 }
@@ -115,6 +134,15 @@ resource "aws_s3_bucket" "artifacts" {
       }
     }
   }
+
+  # parts of streamed uploads that were never completed or aborted, e.g.
+  # when a lambda timed out, are removed instead of being billed
+  lifecycle_rule {
+    id      = "abort-incomplete-multipart-uploads"
+    enabled = true
+
+    abort_incomplete_multipart_upload_days = 1
+  }
 }
 
 locals {
@@ -142,7 +170,8 @@ resource "aws_s3_bucket_policy" "artifacts" {
             "Action": [
                 "s3:GetObject",
                 "s3:PutObject",
-                "s3:DeleteObject"
+                "s3:DeleteObject",
+                "s3:AbortMultipartUpload"
             ],
             "Resource": "${aws_s3_bucket.artifacts.arn}/*"
         }
@@ -0,0 +1,27 @@
+resource "random_string" "this" {
+  length  = 8
+  special = false
+  upper   = false
+}
+
+module "lambda_layer" {
+  source = "git::https://github.com/terraform-aws-modules/terraform-aws-lambda.git?ref=v8.8.1"
+
+  create_layer = true
+
+  description = "Contains the modules shared by the ldap maintainer lambda functions"
+  layer_name  = "${var.project_name}-common-${random_string.this.result}"
+  runtime     = "python3"
+
+  source_path = [
+    {
+      path          = "${path.module}/python"
+      prefix_in_zip = "python"
+    }
+  ]
+
+  compatible_runtimes = [
+    "python3.7",
+    "python3.8"
+  ]
+}
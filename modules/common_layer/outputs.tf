@@ -0,0 +1,4 @@
+output "layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  value       = module.lambda_layer.this_lambda_layer_arn
+}
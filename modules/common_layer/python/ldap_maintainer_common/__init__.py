@@ -0,0 +1,4 @@
+"""Modules shared by the ldap maintainer lambda functions
+
+Deployed to the functions as a lambda layer by the common_layer module.
+"""
@@ -0,0 +1,75 @@
+"""Lazy imports and clients shared by the ldap maintainer lambda functions
+
+Heavy modules, and the clients created from them, are loaded when a handler
+first uses them instead of while the function is initialized, so a cold start
+only pays for what the invocation needs.
+"""
+
+import importlib
+import threading
+
+_UNSET = object()
+# boto3's default session is not thread safe while it creates clients
+_CLIENT_LOCK = threading.Lock()
+
+
+# the proxy has no interface of its own, it is the interface of its target
+class Lazy:  # pylint: disable=too-few-public-methods
+    """
+    Proxy for the object returned by factory.
+
+    The factory is called on the first attribute access, once, even when the
+    proxy is shared by several threads.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._target = _UNSET
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def _resolve(self):
+        if self._target is _UNSET:
+            with self._lock:
+                if self._target is _UNSET:
+                    self._target = self._factory()
+        return self._target
+
+
+def lazy_import(name):
+    """Returns a proxy for the named module, imported on its first use."""
+    return Lazy(lambda: importlib.import_module(name))
+
+
+def lazy_client(service, **config):
+    """
+    Returns a proxy for a boto3 client of the service, created on its first
+    use. Any keyword arguments are passed to botocore's Config.
+    """
+
+    def create():
+        boto3 = importlib.import_module("boto3")
+        with _CLIENT_LOCK:
+            if config:
+                # botocore is only imported once a configured client is created
+                from botocore.config import (  # pylint: disable=import-outside-toplevel
+                    Config,
+                )
+
+                return boto3.client(service, config=Config(**config))
+            return boto3.client(service)
+
+    return Lazy(create)
+
+
+def lazy_resource(service):
+    """Returns a proxy for a boto3 resource of the service."""
+
+    def create():
+        boto3 = importlib.import_module("boto3")
+        with _CLIENT_LOCK:
+            return boto3.resource(service)
+
+    return Lazy(create)
@@ -0,0 +1,95 @@
+"""Structured logging shared by the ldap maintainer lambda functions
+
+Per-record messages on hot paths are sampled and only formatted when the
+debug level is enabled. Each phase of a run is summarized by a single
+structured record instead.
+"""
+
+import collections
+import json
+import logging
+import os
+
+DEFAULT_LOG_LEVEL = logging.INFO
+LOG_LEVELS = collections.defaultdict(
+    lambda: DEFAULT_LOG_LEVEL,
+    {
+        "critical": logging.CRITICAL,
+        "error": logging.ERROR,
+        "warning": logging.WARNING,
+        "info": logging.INFO,
+        "debug": logging.DEBUG,
+    },
+)
+# one in every DEFAULT_SAMPLE_RATE records of a phase is logged at debug level
+DEFAULT_SAMPLE_RATE = 1000
+
+
+def configure_logging(name, log_file_name):
+    """
+    Configures the root logger and returns the logger of the named module.
+
+    Outside of lambda the output is written to log_file_name.
+    """
+    # Lambda initializes a root logger that needs to be removed in order to set
+    # a different logging config
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if os.environ.get("AWS_EXECUTION_ENV"):
+        log_file_name = ""
+
+    logging.basicConfig(
+        filename=log_file_name,
+        format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S",
+        level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
+    )
+    return logging.getLogger(name)
+
+
+def log_event(log, level, event, **fields):
+    """Logs the event along with its fields as a json object."""
+    if log.isEnabledFor(level):
+        log.log(level, "%s %s", event, json.dumps(fields, default=str))
+
+
+class PhaseLog:
+    """
+    Logs the records processed by a phase.
+
+    The debug level is checked once, so records that are not sampled cost a
+    counter increment. When the phase is complete a single summary record
+    with the number of records and the counters of the phase is logged.
+    """
+
+    def __init__(self, log, phase, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.log = log
+        self.phase = phase
+        self.sample_rate = max(int(sample_rate), 1)
+        self.debug = log.isEnabledFor(logging.DEBUG)
+        self.records = 0
+        self.counts = collections.Counter()
+
+    def record(self, message, *args):
+        """Counts a record, logging a sample of them at debug level."""
+        self.records += 1
+        if self.debug and (self.records - 1) % self.sample_rate == 0:
+            self.log.debug("[%s sample] " + message, self.phase, *args)
+
+    def count(self, key, value=1):
+        """Adds value to the counter of key, reported in the summary."""
+        self.counts[key] += value
+
+    def summary(self, level=logging.INFO, **fields):
+        """Logs the summary record of the phase."""
+        log_event(
+            self.log,
+            level,
+            f"{self.phase} complete",
+            phase=self.phase,
+            records=self.records,
+            **self.counts,
+            **fields,
+        )
@@ -0,0 +1,287 @@
+"""Retries shared by the ldap maintainer lambda functions
+
+Errors are classified as retryable, as retryable over a new connection, or as
+fatal. Retries are delayed by a random time up to an exponentially growing
+cap ("full jitter"), so clients pushed back by the server at the same time
+don't all retry at the same time. AdaptiveWindow shrinks the number of
+concurrent requests when the server pushes back and grows it again as
+requests succeed.
+"""
+
+import collections
+import functools
+import logging
+import random
+import threading
+import time
+
+RETRY = "retry"
+RECONNECT = "reconnect"
+FATAL = "fatal"
+
+DEFAULT_MAX_ATTEMPTS = 5
+# seconds, the cap of the delay doubles with every attempt up to the maximum
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 20
+# marks the end of the items of a pipeline
+_DONE = object()
+
+log = logging.getLogger(__name__)
+
+
+class RetryStats:
+    """
+    Counts the attempts, retries and failures of each operation along with
+    their latency. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets the stats of every operation."""
+        with self.lock:
+            self.operations = {}
+
+    def record(self, operation, latency, error=None, retried=False):
+        """Records an attempt, and its error if it failed."""
+        with self.lock:
+            stats = self.operations.setdefault(
+                operation,
+                {
+                    "attempts": 0,
+                    "retries": 0,
+                    "failures": 0,
+                    "latency": 0.0,
+                    "max_latency": 0.0,
+                    "errors": collections.Counter(),
+                },
+            )
+            stats["attempts"] += 1
+            stats["latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            if error is None:
+                return
+            stats["errors"][type(error).__name__] += 1
+            if retried:
+                stats["retries"] += 1
+            else:
+                stats["failures"] += 1
+
+    def as_dict(self):
+        """Returns the counters of each operation, latencies in seconds."""
+        with self.lock:
+            return {
+                operation: dict(stats, errors=dict(stats["errors"]))
+                for operation, stats in self.operations.items()
+            }
+
+
+class Retrier:
+    """
+    Retries the operations that fail with a retryable error.
+
+    Errors that are instances of `reconnect` are only retried when the
+    caller is able to provide a new connection. Any other error that is not
+    an instance of `retryable` is fatal, as is the last error of an
+    operation that has been attempted max_attempts times.
+    """
+
+    # the retry policy is configured by keyword, with defaults for each setting
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        retryable=(),
+        reconnect=(),
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        sleep=time.sleep,
+    ):
+        self.retryable = tuple(retryable)
+        self.reconnect = tuple(reconnect)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.stats = RetryStats()
+
+    def classify(self, error):
+        """Returns RETRY, RECONNECT or FATAL."""
+        if isinstance(error, self.reconnect):
+            return RECONNECT
+        if isinstance(error, self.retryable):
+            return RETRY
+        return FATAL
+
+    def get_delay(self, attempt):
+        """Returns a random delay before the retry that follows the attempt."""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+    def handle_error(self, operation, error, attempt, latency=0, can_reconnect=False):
+        """
+        Records the failed attempt and returns what to do about it: RETRY,
+        RECONNECT (retry over a new connection) or FATAL.
+        """
+        action = self.classify(error)
+        if action == RECONNECT and not can_reconnect:
+            action = FATAL
+        if attempt >= self.max_attempts:
+            action = FATAL
+        self.stats.record(operation, latency, error, retried=action != FATAL)
+        return action
+
+    def backoff(self, operation, error, attempt):
+        """Sleeps before the retry that follows the attempt."""
+        delay = self.get_delay(attempt)
+        log.warning(
+            "%s failed on attempt %s of %s (%s), retrying in %.2f seconds",
+            operation,
+            attempt,
+            self.max_attempts,
+            error,
+            delay,
+        )
+        self.sleep(delay)
+
+    def call(self, operation, func, reconnect=None):
+        """
+        Returns the result of func, retrying it when it fails with a
+        retryable error. reconnect is called before an attempt that follows
+        an error requiring a new connection.
+        """
+        attempt = 1
+        needs_connection = False
+        while True:
+            start = time.perf_counter()
+            try:
+                if needs_connection:
+                    reconnect()
+                    needs_connection = False
+                result = func()
+            except Exception as e:  # pylint: disable=broad-except
+                action = self.handle_error(
+                    operation,
+                    e,
+                    attempt,
+                    time.perf_counter() - start,
+                    can_reconnect=reconnect is not None,
+                )
+                if action == FATAL:
+                    raise
+                needs_connection = needs_connection or action == RECONNECT
+                self.backoff(operation, e, attempt)
+                attempt += 1
+            else:
+                self.stats.record(operation, time.perf_counter() - start)
+                return result
+
+    # the callbacks keep the pipeline free of any one client's request api, and
+    # its bookkeeping is kept in locals shared by its nested helpers
+    # pylint: disable-next=too-many-locals
+    def pipeline(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, operation, items, send, receive, on_result, window, reconnect=None
+    ):
+        """
+        Sends an asynchronous request for each of the items, keeping up to
+        window requests outstanding, fewer while the server pushes back.
+
+        send(item) sends the request of an item and returns its id, and
+        receive(id) returns its result or raises its error. The items are
+        read as the window frees up. Requests that fail with a retryable
+        error are sent again after a backoff, over a new connection from
+        reconnect() when the error requires one, so send and receive must use
+        the current connection. on_result(item, result, error) is called once
+        per item, with the error of the requests that failed for good.
+        """
+        items = iter(items)
+        window = AdaptiveWindow(window)
+        # (item, attempt) of the requests waiting to be sent again
+        retries = collections.deque()
+        # (id, item, attempt, time sent) of the requests awaiting a response
+        outstanding = collections.deque()
+
+        def new_connection():
+            # the outstanding requests were lost along with the connection
+            retries.extend((item, attempt) for _, item, attempt, _ in outstanding)
+            outstanding.clear()
+            reconnect()
+
+        def next_item():
+            if retries:
+                return retries.popleft()
+            item = next(items, _DONE)
+            return None if item is _DONE else (item, 1)
+
+        def collect():
+            request_id, item, attempt, sent = outstanding.popleft()
+            try:
+                result = receive(request_id)
+            except Exception as e:  # pylint: disable=broad-except
+                action = self.handle_error(
+                    operation,
+                    e,
+                    attempt,
+                    time.perf_counter() - sent,
+                    can_reconnect=reconnect is not None,
+                )
+                if action == FATAL:
+                    on_result(item, None, e)
+                    return
+                window.on_pushback()
+                self.backoff(operation, e, attempt)
+                retries.append((item, attempt + 1))
+                if action == RECONNECT:
+                    new_connection()
+            else:
+                self.stats.record(operation, time.perf_counter() - sent)
+                window.on_success()
+                on_result(item, result, None)
+
+        while True:
+            while len(outstanding) < window.size:
+                entry = next_item()
+                if entry is None:
+                    break
+                item, attempt = entry
+                request_id = self.call(
+                    f"{operation}_request",
+                    functools.partial(send, item),
+                    new_connection if reconnect is not None else None,
+                )
+                outstanding.append((request_id, item, attempt, time.perf_counter()))
+            if not outstanding:
+                break
+            collect()
+
+
+class AdaptiveWindow:
+    """
+    Number of requests to keep outstanding, adjusted by additive increase
+    and multiplicative decrease.
+
+    The window is halved every time the server pushes back and grows by one
+    after each window's worth of successful requests, up to its initial
+    size.
+    """
+
+    def __init__(self, size, minimum=1):
+        self.maximum = max(int(size), minimum)
+        self.minimum = minimum
+        self.size = self.maximum
+        self.successes = 0
+
+    def on_success(self):
+        """Grows the window by one after a window's worth of successes."""
+        if self.size >= self.maximum:
+            return
+        self.successes += 1
+        if self.successes >= self.size:
+            self.size += 1
+            self.successes = 0
+
+    def on_pushback(self):
+        """Halves the window, down to its minimum."""
+        self.size = max(self.minimum, self.size // 2)
+        self.successes = 0
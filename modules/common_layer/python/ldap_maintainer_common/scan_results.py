@@ -0,0 +1,74 @@
+"""Scan results shared by the ldap maintainer lambda functions
+
+The LDAP Query function writes the users of a scan as gzip compressed newline
+delimited json, one record per user, which the functions acting on the scan
+read back one user at a time.
+"""
+
+import gzip
+import json
+
+SCAN_RESULTS_EXTENSION = "ndjson.gz"
+# points to the artifacts of the latest scan, written by the LDAP Query function
+# after every scan so they can be found without listing the bucket
+LATEST_REPORT_MANIFEST = "manifests/latest_report.json"
+
+
+class RecordWriter:
+    """Writes records to a file-like object as gzip compressed ndjson."""
+
+    def __init__(self, fileobj):
+        self.gz = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6)
+        self.records_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record):
+        """Writes the record as a line of json."""
+        self.gz.write(json.dumps(record).encode("utf-8") + b"\n")
+        self.records_written += 1
+
+    def close(self):
+        """Writes the gzip trailer, fileobj is left open."""
+        self.gz.close()
+
+
+def iter_records(fileobj):
+    """Yields the records of gzip compressed ndjson read from fileobj."""
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_scan_results(s3, bucket, key):
+    """
+    Yields the user records of a scan results artifact.
+
+    Gzip compressed ndjson artifacts are decoded one record at a time from
+    the s3 body stream. Artifacts in the previous single document json format
+    are converted to the same records.
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    if key.endswith(SCAN_RESULTS_EXTENSION):
+        yield from iter_records(body)
+    else:
+        scan_results = json.loads(body.read().decode("utf-8"))
+        for days_since_pwdlastset, users in scan_results.items():
+            for user in users:
+                yield dict(user, days_since_pwdlastset=days_since_pwdlastset)
+
+
+def iter_users_to_disable(s3, bucket, key, days_since_pwdlastset):
+    """
+    Yields the users of a scan results artifact that are disabled, the users
+    of every threshold at or above days_since_pwdlastset.
+    """
+    threshold = int(days_since_pwdlastset)
+    for user in iter_scan_results(s3, bucket, key):
+        if int(user["days_since_pwdlastset"]) >= threshold:
+            yield user
@@ -6,50 +6,19 @@ Returns:
     null
 """
 
-import collections
-import json
-import logging
 import os
 
-import boto3
+from ldap_maintainer_common.lazy import Lazy, lazy_client, lazy_resource
+from ldap_maintainer_common.logs import PhaseLog, configure_logging
+from ldap_maintainer_common.scan_results import iter_users_to_disable
 
-s3 = boto3.client("s3")
+s3 = lazy_client("s3")
 
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
-)
+log = configure_logging(__name__, "dynamodb_cleanup.log")
 
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for log_handler in root.handlers:
-        root.removeHandler(log_handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "dynamodb_cleanup.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
-)
-log = logging.getLogger(__name__)
-
-
-dynamodb = boto3.client("dynamodb")
-dynamodb_resource = boto3.resource("dynamodb")
-table = dynamodb_resource.Table(os.environ["DYNAMODB_TABLE"])
+dynamodb = lazy_client("dynamodb")
+dynamodb_resource = lazy_resource("dynamodb")
+table = Lazy(lambda: dynamodb_resource.Table(os.environ["DYNAMODB_TABLE"]))
 
 
 def scan_table(scan_attributes):
@@ -59,7 +28,7 @@ def scan_table(scan_attributes):
     )
 
 
-def modify_scan_results(email_address, scan_results):
+def modify_scan_results(email_address, scan_results, phase_log):
     """Modify DynamoDB scan results to remove the provided email address.
 
     Arguments:
@@ -68,6 +37,8 @@ def modify_scan_results(email_address, scan_results):
         scan_results {dictionary} -- json blob containing the results of the
             target DynamoDB table scan
 
+        phase_log {PhaseLog} -- counts the removals, each one is logged
+
     Returns:
         dictionary -- json blob with the updated scan results. If an email
         address was flagged for removal it will be denoted with the
@@ -80,18 +51,22 @@ def modify_scan_results(email_address, scan_results):
                 if email_address in email_distro:
                     email_distro.remove(email_address)
                     item["has_updates"] = True
+                    # the audit trail of the distribution lists that changed
                     log.info("removed %s from %s", email_address, distro)
+                    phase_log.count("distro_removals")
         except KeyError:
             continue
     return scan_results
 
 
-def apply_scan_results(updated_scan_results):
+def apply_scan_results(updated_scan_results, phase_log):
     """Apply the updated DynamoDB scan results.
 
     Arguments:
         updated_scan_results {dictionary} -- Json blob containing
         the updated scan results
+
+        phase_log {PhaseLog} -- counts the updated items, each one is logged
     """
     for item in updated_scan_results["Items"]:
         if item.get("has_updates"):
@@ -102,40 +77,41 @@ def apply_scan_results(updated_scan_results):
                 ReturnValues="UPDATED_NEW",
             )
             log.info("updated %s", item["account_name"])
-
-
-def retrieve_s3_object_contents(s3_obj, bucket=os.environ["ARTIFACTS_BUCKET"]):
-    """Retrieve S3 object contents."""
-    return json.loads(
-        s3.get_object(Bucket=bucket, Key=s3_obj)["Body"].read().decode("utf-8")
-    )
+            phase_log.count("item_updates")
 
 
 # this should probably be called recursively for all users in the input list
 # otherwise this task will be very 'chatty'
 # https://realpython.com/python-thinking-recursively/
-def remove_user(email, scan_results):
+def remove_user(email, scan_results, phase_log):
     """Remove user from scan results."""
-    updated_scan_results = modify_scan_results(email, scan_results)
-    apply_scan_results(updated_scan_results)
+    phase_log.record("removing user: %s", email)
+    updated_scan_results = modify_scan_results(email, scan_results, phase_log)
+    apply_scan_results(updated_scan_results, phase_log)
 
 
 def remove_users_in_list(users):
     """Remove users in list."""
     scan_attributes = ["account_name", "email_distros"]
     scan_results = scan_table(scan_attributes)
+    phase_log = PhaseLog(log, "remove_users")
     for user in users:
-        remove_user(user["email"], scan_results)
+        remove_user(user["email"], scan_results, phase_log)
+    phase_log.summary()
 
 
 def handler(event, context):  # pylint: disable=unused-argument
     """Entrypoint for lambda handler."""
     log.debug("Received event: %s", event)
     if event["action"] == "remove":
-        days_since_pwdlastset = os.environ("DAYS_SINCE_PWDLASTSET")
-        users = retrieve_s3_object_contents(event["ldap_scan_results"])[
-            days_since_pwdlastset
-        ]
+        # the users of every threshold at or above DAYS_SINCE_PWDLASTSET
+        # have been disabled
+        users = iter_users_to_disable(
+            s3,
+            os.environ["ARTIFACTS_BUCKET"],
+            event["ldap_scan_results"],
+            os.environ["DAYS_SINCE_PWDLASTSET"],
+        )
         remove_users_in_list(users)
         log.info("Successfully removed the stale users from dynamodb")
         return event
@@ -67,4 +67,6 @@ module "lambda" {
 
   policy = var.dynamodb_table_arn == "" ? data.aws_iam_policy_document.placeholder : data.aws_iam_policy_document.lambda
 
+  layers = [var.common_layer_arn]
+
 }
@@ -4,51 +4,448 @@
 Requires the credentials of a user with domain admin privileges
 """
 
+import bisect
+import calendar
 import collections
+import collections.abc
+import contextlib
 import fnmatch
+import functools
+import hashlib
+import importlib.util
+import itertools
 import json
 import logging
 import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlparse
 
-import boto3
 import ldap
-import ldap.asyncsearch
-from jinja2 import Environment, FileSystemLoader
+from ldap.controls import LDAPControl, SimplePagedResultsControl
+from ldap.filter import escape_filter_chars
+from ldap_maintainer_common.lazy import lazy_client, lazy_import
+from ldap_maintainer_common.logs import PhaseLog, configure_logging, log_event
+from ldap_maintainer_common.retry import Retrier
+from ldap_maintainer_common.scan_results import (
+    LATEST_REPORT_MANIFEST,
+    SCAN_RESULTS_EXTENSION,
+    RecordWriter,
+    iter_scan_results,
+    iter_users_to_disable,
+)
 
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
+# numpy is optional, and only imported once a batch of users is classified
+numpy = lazy_import("numpy") if importlib.util.find_spec("numpy") else None
+
+log = configure_logging(__name__, "ldap_query.log")
+
+# Active Directory's default MaxPageSize is 1000, larger pages are truncated by
+# the server to that value
+DEFAULT_PAGE_SIZE = 1000
+# Maximum number of modify requests awaiting a response from the server
+DEFAULT_MODIFY_WINDOW = 50
+# failed modifies returned with the results, they are all logged
+FAILURE_SAMPLE_SIZE = 10
+# sAMAccountName ranges of a sharded scan are split on these characters
+SHARD_BOUNDARY_CHARACTERS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# pages of a sharded scan waiting to be processed, per shard
+SHARD_QUEUE_DEPTH = 2
+# errors of a directory that is overloaded or briefly unavailable
+RETRYABLE_LDAP_ERRORS = (ldap.BUSY, ldap.UNAVAILABLE, ldap.TIMEOUT)
+# errors after which the connection can no longer be used
+CONNECTION_LDAP_ERRORS = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR)
+
+USER_FILTER = "(objectCategory=person)(objectClass=user)"
+TEST_DESCRIPTION = "***TEST***"
+
+# userAccountControl flags of accounts that are never processed
+# https://support.microsoft.com/en-us/help/305144/how-to-use-useraccountcontrol-to-manipulate-user-account-properties  # noqa: E501  # pylint: disable=line-too-long
+UF_ACCOUNTDISABLE = 0x0002
+UF_DONT_EXPIRE_PASSWD = 0x10000
+EXCLUDED_UAC_FLAGS = (UF_ACCOUNTDISABLE, UF_DONT_EXPIRE_PASSWD)
+LDAP_MATCHING_RULE_BIT_AND = "1.2.840.113556.1.4.803"
+
+# Returns deleted objects (tombstones) so removals can be tracked by
+# incremental scans
+LDAP_SERVER_SHOW_DELETED_OID = "1.2.840.113556.1.4.417"
+SCAN_STATE_PREFIX = "scan_state"
+
+
+def decode_string(value):
+    return value.decode(encoding="utf-8", errors="ignore")
+
+
+def decode_integer(value):
+    return int(value)
+
+
+def decode_binary(value):
+    return value.hex()
+
+
+# decoder of a user attribute, and whether the attribute is only requested
+# for the snapshot of an incremental scan
+Attribute = collections.namedtuple(
+    "Attribute", ["decode", "snapshot_only"], defaults=[False]
 )
+# the user attributes that are read, keyed by attribute name. The attributes
+# requested by the searches are derived from it, the server returns no others
+ATTRIBUTE_SCHEMA = {
+    "cn": Attribute(decode_string),
+    "mail": Attribute(decode_string),
+    "distinguishedName": Attribute(decode_string),
+    "pwdLastSet": Attribute(decode_integer),
+    "description": Attribute(decode_string),
+    "userAccountControl": Attribute(decode_integer),
+    "sAMAccountName": Attribute(decode_string),
+    "objectGUID": Attribute(decode_binary, snapshot_only=True),
+    "isDeleted": Attribute(decode_string, snapshot_only=True),
+}
+# decodes attributes missing from the schema
+DEFAULT_ATTRIBUTE = Attribute(decode_string)
+# attributes requested by the query
+USER_ATTRIBUTES = [
+    name for name, attribute in ATTRIBUTE_SCHEMA.items() if not attribute.snapshot_only
+]
+# attributes kept in the snapshot of an incremental scan
+SNAPSHOT_ATTRIBUTES = list(ATTRIBUTE_SCHEMA)
+
+# January 1, 1970 as MS file time
+EPOCH_AS_FILETIME = 116444736000000000
+HUNDREDS_OF_NANOSECONDS = 10000000
+FILETIME_TICKS_PER_DAY = 86400 * HUNDREDS_OF_NANOSECONDS
+
+# S3 requires every part of a multipart upload but the last to be >= 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+# seconds the presigned urls of the artifacts are valid for
+PRESIGNED_URL_EXPIRATION = 3600
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+# optional output of jinja2.Environment.compile_templates for TEMPLATES_DIR
+COMPILED_TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "compiled_templates")
+
+# artifacts are uploaded concurrently over the shared s3 client
+MAX_ARTIFACT_WORKERS = 8
+# batches of stale users waiting to be written, per artifact
+ARTIFACT_QUEUE_DEPTH = 2
+HTML_TABLE_HEADERS = ["name", "email", "days_since_last_pwd_change"]
+
+# only the query action renders templates
+jinja2 = lazy_import("jinja2")
+# python-ldap's ldif module, only used by the get_ldif action
+ldif = lazy_import("ldif")
+s3 = lazy_client("s3", max_pool_connections=MAX_ARTIFACT_WORKERS * 2)
+ssm = lazy_client("ssm")
+
+
+class Metrics:
+    """
+    Collects the duration, entry count and bytes of each phase of a run.
+
+    The time spent in a phase excludes the time spent in the phases nested
+    in it, per thread. Phases are timed around whole pages, batches and
+    requests so the overhead doesn't grow with the number of entries.
+    Metrics are printed as CloudWatch Embedded Metric Format log lines, one
+    per phase, in lambda and as a summary table otherwise.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """Discards the collected metrics and restarts the run timer."""
+        with self.lock:
+            self.start = time.perf_counter()
+            self.phases = {}
+
+    def add(self, phase, duration=0, entries=0, bytes=0):
+        with self.lock:
+            totals = self.phases.setdefault(
+                phase, {"duration": 0.0, "entries": 0, "bytes": 0}
+            )
+            totals["duration"] += duration
+            totals["entries"] += entries
+            totals["bytes"] += bytes
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Times the block as the named phase.
+
+        The block must not yield, or the time spent by the consumer would
+        be charged to the phase.
+        """
+        stack = self.local.__dict__.setdefault("stack", [])
+        now = time.perf_counter()
+        if stack:
+            self.add(stack[-1], now - self.local.mark)
+        stack.append(name)
+        self.local.mark = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.add(stack.pop(), now - self.local.mark)
+            self.local.mark = now
+
+    def get_records(self):
+        """Returns the metrics of each phase and of the whole run."""
+        records = []
+        with self.lock:
+            phases = dict(self.phases)
+            phases["total"] = {
+                "duration": time.perf_counter() - self.start,
+                "entries": 0,
+                "bytes": 0,
+            }
+        for name, totals in phases.items():
+            duration = totals["duration"]
+            records.append(
+                {
+                    "Phase": name,
+                    "Duration": round(duration * 1000, 3),
+                    "Entries": totals["entries"],
+                    "Bytes": totals["bytes"],
+                    "Throughput": (
+                        round(totals["entries"] / duration, 3) if duration else 0
+                    ),
+                }
+            )
+        return records
+
+    def flush(self, action):
+        """Prints the collected metrics of the action and resets them."""
+        records = self.get_records()
+        if os.environ.get("AWS_EXECUTION_ENV"):
+            timestamp = int(time.time() * 1000)
+            for record in records:
+                print(json.dumps(self.get_emf_document(action, record, timestamp)))
+        else:
+            print(
+                f"{'phase':<16}{'seconds':>10}{'entries':>10}"
+                f"{'bytes':>14}{'entries/s':>12}"
+            )
+            for record in records:
+                print(
+                    f"{record['Phase']:<16}{record['Duration'] / 1000:>10.3f}"
+                    f"{record['Entries']:>10}{record['Bytes']:>14}"
+                    f"{record['Throughput']:>12.0f}"
+                )
+        self.reset()
+
+    def get_emf_document(self, action, record, timestamp):
+        """
+        Returns the Embedded Metric Format document of a phase.
+        ref: https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html  # noqa: E501  # pylint: disable=line-too-long
+        """
+        return dict(
+            record,
+            Action=action,
+            _aws={
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Action", "Phase"]],
+                        "Metrics": [
+                            {"Name": "Duration", "Unit": "Milliseconds"},
+                            {"Name": "Entries", "Unit": "Count"},
+                            {"Name": "Bytes", "Unit": "Bytes"},
+                            {"Name": "Throughput", "Unit": "Count/Second"},
+                        ],
+                    }
+                ],
+            },
+        )
+
+
+metrics = Metrics(os.environ.get("METRICS_NAMESPACE", "LdapMaintainer"))
+
 
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for log_handler in root.handlers:
-        root.removeHandler(log_handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "ldap_query.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
+def retry_sleep(seconds):
+    """Waits before a retry, timed as the retry_wait phase."""
+    with metrics.phase("retry_wait"):
+        time.sleep(seconds)
+
+
+ldap_retrier = Retrier(
+    retryable=RETRYABLE_LDAP_ERRORS,
+    reconnect=CONNECTION_LDAP_ERRORS,
+    sleep=retry_sleep,
 )
-log = logging.getLogger(__name__)
 
-s3 = boto3.client("s3")
-ssm = boto3.client("ssm")
+
+class ConnectionManager:
+    """
+    Keeps a bound LDAP connection open across warm invocations of the lambda.
+
+    The connection is checked with a rootDSE read before it is reused and
+    is re-established when the check fails or the credentials change.
+    """
+
+    LIVENESS_TIMEOUT = 5
+
+    def __init__(self):
+        self.connection = None
+        self.credentials = None
+
+    def get_connection(self, ldaps_url, svc_user_dn, svc_user_pwd):
+        """Returns a bound connection to the LDAP server."""
+        credentials = (
+            ldaps_url,
+            svc_user_dn,
+            hashlib.sha256(svc_user_pwd.encode("utf-8")).hexdigest(),
+        )
+        if self.credentials == credentials and self.is_alive():
+            log.debug("Reusing the existing LDAP connection.")
+            return self.connection
+        self.close()
+        self.connection = self.connect(ldaps_url, svc_user_dn, svc_user_pwd)
+        self.credentials = credentials
+        return self.connection
+
+    @staticmethod
+    def connect(ldaps_url, svc_user_dn, svc_user_pwd):
+        """Establish a connection to the LDAP server."""
+        log.debug("Attempting to connect to the LDAP server..")
+
+        def bind():
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+            con = ldap.initialize(ldaps_url)
+            con.set_option(ldap.OPT_REFERRALS, 0)
+            con.bind_s(svc_user_dn, svc_user_pwd)
+            return con
+
+        with metrics.phase("bind"):
+            # every attempt binds a new connection
+            con = ldap_retrier.call("bind", bind, reconnect=lambda: None)
+        log.debug("Successfully connected to LDAP server.")
+        return con
+
+    def is_alive(self):
+        """Returns True if the current connection answers a rootDSE read."""
+        if self.connection is None:
+            return False
+        try:
+            self.connection.search_ext_s(
+                "",
+                ldap.SCOPE_BASE,
+                "(objectClass=*)",
+                ["1.1"],
+                timeout=self.LIVENESS_TIMEOUT,
+            )
+        except ldap.LDAPError as e:
+            log.debug("Existing LDAP connection is no longer usable: %s", e)
+            return False
+        return True
+
+    def close(self):
+        """Unbinds the current connection, if there is one."""
+        if self.connection is not None:
+            try:
+                self.connection.unbind_s()
+            except ldap.LDAPError:
+                pass
+        self.connection = None
+        self.credentials = None
+
+
+connection_manager = ConnectionManager()
+# one connection per shard of a sharded scan, the first one is shared
+shard_connection_managers = [connection_manager]
+
+
+def get_shard_connection_manager(index):
+    """Returns the connection manager of the shard at the provided index."""
+    while len(shard_connection_managers) <= index:
+        shard_connection_managers.append(ConnectionManager())
+    return shard_connection_managers[index]
+
+
+class HandsOffMatcher:
+    """
+    Matches the accounts that must never be processed.
+
+    Built once from the hands off account patterns: names without glob
+    characters are kept in a set while the glob patterns are compiled into a
+    single regular expression. Accounts whose userAccountControl has any of
+    the excluded flags set are matched with a bitmask test.
+    """
+
+    GLOB_CHARACTERS = frozenset("*?[")
+
+    def __init__(self, patterns, excluded_uac_flags=EXCLUDED_UAC_FLAGS):
+        self.names = frozenset(
+            pattern for pattern in patterns if not self.is_glob(pattern)
+        )
+        globs = [pattern for pattern in patterns if self.is_glob(pattern)]
+        self.regex = None
+        if globs:
+            self.regex = re.compile("|".join(fnmatch.translate(g) for g in globs))
+        self.excluded_uac_mask = 0
+        for flag in excluded_uac_flags:
+            self.excluded_uac_mask |= flag
+
+    @classmethod
+    def is_glob(cls, pattern):
+        return not cls.GLOB_CHARACTERS.isdisjoint(pattern)
+
+    def matches(self, sam_name, uac):
+        """Returns True if the account must not be processed."""
+        try:
+            if int(uac) & self.excluded_uac_mask:
+                return True
+        except (TypeError, ValueError):
+            pass
+        if sam_name in self.names:
+            return True
+        return self.regex is not None and self.regex.match(sam_name) is not None
+
+
+class LdapUser(collections.abc.Mapping):
+    """
+    Read-only mapping of the attributes of a user object returned by a
+    search.
+
+    The values of an attribute are decoded with its decoder from
+    ATTRIBUTE_SCHEMA the first time the attribute is accessed and cached,
+    attributes that are never read are never decoded. Attributes missing
+    from the schema are decoded as utf-8 strings.
+    """
+
+    __slots__ = ("raw", "decoded")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.decoded = {}
+
+    def __getitem__(self, attribute):
+        try:
+            return self.decoded[attribute]
+        except KeyError:
+            pass
+        values = self.raw[attribute]
+        decode = ATTRIBUTE_SCHEMA.get(attribute, DEFAULT_ATTRIBUTE).decode
+        decoded = [decode(value) for value in values]
+        self.decoded[attribute] = decoded
+        return decoded
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f"LdapUser({dict(self)!r})"
 
 
 class LdapMaintainer:
@@ -61,6 +458,11 @@ class LdapMaintainer:
         days_since_pwdlastset,
         filter_patterns,
         users_to_disable=[],
+        page_size=DEFAULT_PAGE_SIZE,
+        modify_window=DEFAULT_MODIFY_WINDOW,
+        search_bases=None,
+        scan_shards=1,
+        report_thresholds=None,
     ):
         """Initialize"""
         self.ldaps_url = ldaps_url
@@ -68,98 +470,367 @@ class LdapMaintainer:
         self.svc_user_dn = svc_user_dn
         self.svc_user_pwd = svc_user_pwd
         self.days_since_pwdlastset = int(days_since_pwdlastset)
+        # staleness tiers reported by a scan, in ascending order of days
+        self.thresholds = sorted(
+            {self.days_since_pwdlastset}
+            | {int(threshold) for threshold in report_thresholds or []}
+        )
+        self.page_size = int(page_size)
+        self.modify_window = int(modify_window)
+        self.search_bases = search_bases or [domain_base]
+        self.scan_shards = max(int(scan_shards), 1)
+        # a single point in time is used for every staleness computation
+        self.now_filetime = self.dt_to_filetime(datetime.utcnow())
         self.connection = self.connect()
         self.users_to_disable = users_to_disable
         self.filter_patterns = filter_patterns
+        self.hands_off = HandsOffMatcher(filter_patterns)
 
     def connect(self):
-        """Establish a connection to the LDAP server."""
-        log.debug("Attempting to connect to the LDAP server..")
-        ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-        con = ldap.initialize(self.ldaps_url)
-        con.set_option(ldap.OPT_REFERRALS, 0)
-        con.bind_s(self.svc_user_dn, self.svc_user_pwd)
-        log.debug("Successfully connected to LDAP server.")
-        return con
+        """Returns a bound connection to the LDAP server."""
+        return connection_manager.get_connection(
+            self.ldaps_url, self.svc_user_dn, self.svc_user_pwd
+        )
+
+    def search_pages(
+        self,
+        search_root,
+        filter_string=None,
+        attrlist=None,
+        serverctrls=None,
+        connection=None,
+    ):
+        """
+        Search LDAP using the provided filter string and yield each page of
+        results as it is received.
 
-    def search(self, search_root, filter_string=None):
+        Uses the RFC 2696 Simple Paged Results control so the server never
+        has to return more than self.page_size entries at once. Each page is
+        a list of (dn, attributes) tuples. The search is performed over
+        self.connection unless another connection is provided.
+
+        A page that fails with a retryable error is requested again with the
+        same cookie. A paged search can't be resumed over a new connection,
+        so losing the connection is fatal.
+        """
+        connection = connection or self.connection
+        log.debug(
+            "starting paged search with %s (page size: %s)",
+            filter_string,
+            self.page_size,
+        )
+        page_control = SimplePagedResultsControl(
+            criticality=True, size=self.page_size, cookie=""
+        )
+        page_count = 0
+
+        def fetch_page():
+            msgid = connection.search_ext(
+                search_root,
+                ldap.SCOPE_SUBTREE,
+                filter_string,
+                attrlist,
+                serverctrls=[page_control] + (serverctrls or []),
+            )
+            return connection.result3(msgid)
+
+        while True:
+            with metrics.phase("search"):
+                _, page, _, server_controls = ldap_retrier.call("search", fetch_page)
+            metrics.add("search", entries=len(page))
+            page_count += 1
+            yield page
+
+            cookie = None
+            for control in server_controls:
+                if control.controlType == SimplePagedResultsControl.controlType:
+                    cookie = control.cookie
+            if not cookie:
+                break
+            page_control.cookie = cookie
+        log.debug("paged search complete after %s pages", page_count)
+
+    def search(self, search_root, filter_string=None, attrlist=None, serverctrls=None):
         """Search LDAP using the provided filter string."""
-        log.debug("starting search with %s", filter_string)
-        ldap_async = ldap.asyncsearch.List(self.connection)
-        ldap_async.startSearch(search_root, ldap.SCOPE_SUBTREE, filter_string)
-        try:
-            partial = ldap_async.processResults()
-        except ldap.SIZELIMIT_EXCEEDED:
-            log.error("Warning: Server-side size limit exceeded")
-        else:
-            if partial:
-                log.error("Warning: Only partial results received.")
+        for page in self.search_pages(
+            search_root, filter_string, attrlist, serverctrls
+        ):
+            for entry in page:
+                yield entry
 
-        self.connection.unbind()
-        return ldap_async.allResults
+    def get_shards(self, filter_string):
+        """
+        Returns the (search root, filter) pairs that split a search of the
+        directory into self.scan_shards sAMAccountName ranges per search base.
+        """
+        ranges = get_sam_account_name_ranges(self.scan_shards)
+        return [
+            (
+                search_base,
+                f"(&{filter_string}{range_filter})" if range_filter else filter_string,
+            )
+            for search_base in self.search_bases
+            for range_filter in ranges
+        ]
 
-    def get_all_users(self):
-        """Search LDAP and return all user objects."""
+    def search_sharded(self, filter_string, attrlist=None):
+        """
+        Search the directory shard by shard and yield the entries of every
+        shard.
+
+        When there is more than one shard they are searched concurrently,
+        each over its own connection, and their pages are yielded in the
+        order they are received.
+        """
+        shards = self.get_shards(filter_string)
+        if len(shards) == 1:
+            search_root, shard_filter = shards[0]
+            for entry in self.search(search_root, shard_filter, attrlist):
+                yield entry
+            return
+
+        log.debug("starting sharded search over %s shards", len(shards))
+        pages = queue.Queue(maxsize=len(shards) * SHARD_QUEUE_DEPTH)
+        stop = threading.Event()
+
+        def put(item):
+            # give up once the consumer is gone so the shard can finish
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+
+        def scan(index, search_root, shard_filter):
+            try:
+                connection = get_shard_connection_manager(index).get_connection(
+                    self.ldaps_url, self.svc_user_dn, self.svc_user_pwd
+                )
+                for page in self.search_pages(
+                    search_root, shard_filter, attrlist, connection=connection
+                ):
+                    if stop.is_set():
+                        break
+                    put(page)
+            except Exception as e:  # pylint: disable=broad-except
+                put(e)
+            finally:
+                put(None)
+
+        # create the connection managers before the shards use them
+        get_shard_connection_manager(len(shards) - 1)
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            for index, (search_root, shard_filter) in enumerate(shards):
+                executor.submit(scan, index, search_root, shard_filter)
+            remaining = len(shards)
+            try:
+                while remaining:
+                    with metrics.phase("shard_wait"):
+                        page = pages.get()
+                    if page is None:
+                        remaining -= 1
+                    elif isinstance(page, Exception):
+                        raise page
+                    else:
+                        for entry in page:
+                            yield entry
+            finally:
+                stop.set()
+        log.debug("sharded search complete")
+
+    def get_user_filter(self):
+        """Returns the filter used to search for candidate user objects."""
+        return build_user_filter(
+            excluded_uac_flags=EXCLUDED_UAC_FLAGS,
+            pwdlastset_cutoff=self.now_filetime
+            - self.thresholds[0] * FILETIME_TICKS_PER_DAY,
+        )
+
+    def read_root_dse(self, attributes):
+        """Returns the requested attributes of the server's rootDSE."""
+        _, entry = self.connection.search_ext_s(
+            "", ldap.SCOPE_BASE, "(objectClass=*)", attributes
+        )[0]
+        return {key: value[0].decode("utf-8") for key, value in entry.items()}
+
+    def get_snapshot_users(self):
+        """
+        Yields every active user, regardless of when their password was
+        last set.
+        """
+        return self.byte_decode_search_results(
+            self.search_sharded(
+                build_user_filter(excluded_uac_flags=EXCLUDED_UAC_FLAGS),
+                SNAPSHOT_ATTRIBUTES,
+            )
+        )
+
+    def get_changed_users(self, usn):
+        """
+        Yields the user objects of the search bases created or modified
+        since the provided uSNChanged value.
+        """
+        filter_string = f"(&(uSNChanged>={int(usn) + 1}){USER_FILTER})"
         return self.byte_decode_search_results(
+            self.search_sharded(filter_string, SNAPSHOT_ATTRIBUTES)
+        )
+
+    def get_removed_users(self, usn):
+        """
+        Yields the objectGUIDs of the users deleted, or moved out of the
+        search bases, since the provided uSNChanged value.
+
+        Deleted users are moved to the Deleted Objects container as
+        tombstones, so the whole domain is searched for them. A removal only
+        affects the users that are already in the snapshot.
+        """
+        removed_filter = "(isDeleted=TRUE)"
+        if self.search_bases != [self.domain_base]:
+            removed_filter = f"(|(&{USER_FILTER})(isDeleted=TRUE))"
+        filter_string = f"(&(uSNChanged>={int(usn) + 1}){removed_filter})"
+        for user_obj in self.byte_decode_search_results(
             self.search(
-                self.domain_base, "(&(objectCategory=person)(objectClass=user))"
+                self.domain_base,
+                filter_string,
+                ["objectGUID", "isDeleted"],
+                serverctrls=[LDAPControl(LDAP_SERVER_SHOW_DELETED_OID, True)],
             )
+        ):
+            user = user_obj["user"]
+            deleted = user.get("isDeleted", ["FALSE"])[0] == "TRUE"
+            if deleted or not self.in_search_bases(user_obj["dn"]):
+                yield user["objectGUID"][0]
+
+    def in_search_bases(self, dn):
+        """Returns True if the dn is within one of the search bases."""
+        dn = dn.lower()
+        return any(
+            dn == search_base or dn.endswith(f",{search_base}")
+            for search_base in (base.lower() for base in self.search_bases)
+        )
+
+    def get_all_users(self):
+        """Search LDAP and yield all candidate user objects."""
+        return self.byte_decode_search_results(
+            self.search_sharded(self.get_user_filter(), USER_ATTRIBUTES)
         )
 
     def get_users(self):
         """
-        Returns a list of active users.
+        Yields the active users.
 
         User accounts in the target OU that have been previously disabled
         or configured with passwords that don't expire are ignored.
         """
 
-        non_svc_users = []
-
         # code reference:
         # https://jackstromberg.com/2013/01/useraccountcontrol-attributeflag-values/
 
         for user_obj in self.get_all_users():
-            try:
-                uac = user_obj["user"]["userAccountControl"][0]
-                sam_name = user_obj["user"]["sAMAccountName"][0]
-                if not self.is_special(sam_name, uac):
-                    non_svc_users.append(user_obj["user"])
-            except TypeError:
-                continue
-        # log.debug(f"found users that met filter criteria: {non_svc_users}")
-        return non_svc_users
+            if self.is_candidate(user_obj["user"]):
+                yield user_obj["user"]
 
-    def disable_users(self):
-        con = self.connection
+    def is_candidate(self, user):
+        """Returns True if the user object may be processed."""
+        if user.get("isDeleted", ["FALSE"])[0] == "TRUE":
+            return False
+        try:
+            uac = user["userAccountControl"][0]
+            sam_name = user["sAMAccountName"][0]
+        except (KeyError, TypeError):
+            return False
+        return not self.is_special(sam_name, uac)
+
+    def get_scan_config_hash(self):
+        """
+        Returns a hash of the configuration deciding which users are kept in
+        the snapshot of an incremental scan.
+        """
+        config = {
+            "attributes": SNAPSHOT_ATTRIBUTES,
+            "excluded_uac_flags": sorted(EXCLUDED_UAC_FLAGS),
+            "filter_patterns": sorted(self.filter_patterns),
+            "search_bases": sorted(self.search_bases),
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def get_disable_modlist():
+        """Returns the modifications that disable a user."""
         date = datetime.now().strftime("%Y-%m-%d-T%H%M")
         d = f"***Disabled {date} by ldapmaintbot***"
-        for user_obj in self.users_to_disable:
-            disable_user = [
-                (ldap.MOD_REPLACE, "userAccountControl", [b"514"])
-            ]  # https://support.microsoft.com/en-us/help/305144/how-to-use-useraccountcontrol-to-manipulate-user-account-properties  # pylint: disable=line-too-long
-            update_description = [
-                (ldap.MOD_REPLACE, "description", [d.encode("utf-8")])
-            ]
-            con.modify_s(user_obj["dn"], disable_user)
-            con.modify_s(user_obj["dn"], update_description)
+        return [
+            # https://support.microsoft.com/en-us/help/305144/how-to-use-useraccountcontrol-to-manipulate-user-account-properties  # noqa: E501  # pylint: disable=line-too-long
+            (ldap.MOD_REPLACE, "userAccountControl", [b"514"]),
+            (ldap.MOD_REPLACE, "description", [d.encode("utf-8")]),
+        ]
 
-    def get_days_since_pwdlastset(self, ft):
-        # skip users that have never logged in
-        if ft == "0":
-            return 1
-        else:
-            pwd_last_set = self.filetime_to_dt(ft)
-            today = datetime.now()
-            return (today - pwd_last_set).days
+    def reconnect(self):
+        """Replaces self.connection after the server dropped it."""
+        self.connection = connection_manager.get_connection(
+            self.ldaps_url, self.svc_user_dn, self.svc_user_pwd
+        )
 
-    def get_stale_users(self):
+    def disable_users(self):
+        """
+        Disables the users in self.users_to_disable.
+
+        The userAccountControl and description updates of each user are sent
+        as a single asynchronous modify request. Up to self.modify_window
+        requests are kept outstanding while the results are collected, fewer
+        while the server pushes back. Users whose modify failed with a
+        retryable error are sent again after a backoff, which is safe as the
+        modifications replace the attribute values.
+
+        Returns:
+            dict -- number of users that were disabled and that could not be
+            disabled, along with the dns and errors of up to
+            FAILURE_SAMPLE_SIZE of the failures
         """
-        Returns map of users that have not logged on
-        since number of days defined in self.days_since_pwdlastset
+        modlist = self.get_disable_modlist()
+        results = {"disabled": 0, "failed": 0, "failure_sample": []}
+
+        def send(dn):
+            return self.connection.modify(dn, modlist)
+
+        def receive(msgid):
+            return self.connection.result3(msgid)
+
+        def on_result(dn, result, error):
+            if error is None:
+                results["disabled"] += 1
+                return
+            log.error("Failed to disable %s: %s", dn, error)
+            results["failed"] += 1
+            if len(results["failure_sample"]) < FAILURE_SAMPLE_SIZE:
+                results["failure_sample"].append({"dn": dn, "error": str(error)})
+
+        with metrics.phase("modify"):
+            ldap_retrier.pipeline(
+                "modify",
+                (user_obj["dn"] for user_obj in self.users_to_disable),
+                send,
+                receive,
+                on_result,
+                self.modify_window,
+                reconnect=self.reconnect,
+            )
+        metrics.add("modify", entries=results["disabled"])
+        return results
+
+    def get_stale_users(self, users=None):
+        """
+        Returns map of users that have not changed their password since
+        the number of days of each threshold in self.thresholds
+
+        See iter_stale_users, which this collects into a single map.
 
         example:
         {
+            "90": [],
             "120": [
                 {
                     "name" = "Jane Doe",
@@ -170,74 +841,209 @@ class LdapMaintainer:
             ]
         }
         """
-        stale_users = {f"{self.days_since_pwdlastset}": []}
-        users = self.get_users()
-        for user_obj in users:
-            log.debug("processing user: %s", user_obj)
-            ft = user_obj.get("pwdLastSet", [False]).pop()
-            desc = user_obj.get("description", [False]).pop()
-            days = self.get_days_since_pwdlastset(ft)
+        stale_users = {f"{threshold}": [] for threshold in self.thresholds}
+        for batch in self.iter_stale_users(users):
+            for user in batch:
+                stale_users[user.pop("days_since_pwdlastset")].append(user)
+        return stale_users
+
+    def iter_stale_users(self, users=None):
+        """
+        Yields the users that have not changed their password since the
+        number of days of any threshold in self.thresholds, in batches of
+        the stale users of up to self.page_size users.
+
+        Each user is assigned to the largest threshold it exceeds, recorded
+        as its days_since_pwdlastset. Users labelled with the test
+        description are always assigned to the self.days_since_pwdlastset
+        threshold.
+
+        The users are retrieved from the directory unless an iterable of
+        user objects (e.g. from an incremental scan) is provided.
+
+        example batch:
+        [
+            {
+                "name" = "Jane Doe",
+                "email" = "jane.doe@someemail.com",
+                "dn" = "",
+                "days_since_last_pwd_change" = 130,
+                "days_since_pwdlastset" = "120"
+            }
+        ]
+        """
+        if users is None:
+            users = self.get_users()
+        users = iter(users)
+        phase_log = PhaseLog(log, "get_stale_users")
+        stale_counts = collections.Counter()
+        # staleness is computed a page of users at a time
+        while True:
+            with metrics.phase("decode"):
+                batch = list(itertools.islice(users, self.page_size))
+            if not batch:
+                break
+            metrics.add("decode", entries=len(batch))
+            with metrics.phase("classify"):
+                stale_users = self.classify_users(batch, phase_log)
+            metrics.add("classify", entries=len(batch))
+            stale_counts.update(user["days_since_pwdlastset"] for user in stale_users)
+            yield stale_users
+        phase_log.summary(stale_users=dict(stale_counts))
+
+    def classify_users(self, batch, phase_log):
+        """Returns the stale users of the batch, with their threshold."""
+        stale_users = []
+        days_column = get_days_since_pwdlastset(
+            [int(u.get("pwdLastSet", [0])[-1]) for u in batch],
+            self.now_filetime,
+        )
+        for user_obj, days in zip(batch, days_column):
+            phase_log.record("processing user: %s", user_obj)
+            desc = user_obj.get("description", [False])[-1]
+            if desc == TEST_DESCRIPTION:
+                phase_log.count("test_users")
+                threshold = self.days_since_pwdlastset
+            else:
+                tier = bisect.bisect_right(self.thresholds, days) - 1
+                if tier < 0:
+                    continue
+                threshold = self.thresholds[tier]
             user = {
-                "name": user_obj.get("cn", [False]).pop(),
-                "email": user_obj.get("mail", [False]).pop(),
-                "dn": user_obj.get("distinguishedName", [False]).pop(),
+                "name": user_obj.get("cn", [False])[-1],
+                "email": user_obj.get("mail", [False])[-1],
+                "dn": user_obj.get("distinguishedName", [False])[-1],
                 "days_since_last_pwd_change": days,
+                "days_since_pwdlastset": f"{threshold}",
             }
-            if days >= self.days_since_pwdlastset or desc == "***TEST***":
-                log.info("got stale user: %s", user)
-                stale_users[f"{self.days_since_pwdlastset}"].append(user)
-        log.debug("retrieved the following stale users: %s", stale_users)
+            stale_users.append(user)
         return stale_users
 
-    def get_ldif(self):
-        """Creates a ldif document with the query results"""
-        # could be an alternative way of user disablement
+    @staticmethod
+    def get_ldif(users_to_disable, modlist, output_file):
+        """
+        Writes the modifications in modlist for each of the users to
+        output_file as LDIF change records, one user at a time.
+
+        The records can be applied on a DC with native bulk tooling, e.g.
+        `ldifde -i -f <file>` or `ldapmodify -f <file>`, as an alternative
+        to disable_users. No connection to the directory is needed.
+
+        Returns:
+            int -- number of records written
+        """
+        writer = ldif.LDIFWriter(output_file)
+        for user_obj in users_to_disable:
+            writer.unparse(user_obj["dn"], modlist)
+        return writer.records_written
 
     @staticmethod
     def byte_decode_search_results(search_results):
-        users = []
-        for user in search_results:
-            # if the dn is None, skip it.
-            if not user[1][0]:
+        """
+        Yield user objects from (dn, attributes) results, their attributes
+        are decoded lazily by LdapUser.
+        """
+        for dn, attributes in search_results:
+            # skip search references, they don't have a dn
+            if not dn:
                 continue
-            else:
-                user_obj = {}
-                for attribute in user[1][1]:
-                    if "ldap://" not in attribute:
-                        user[1][1][attribute] = [
-                            item.decode(encoding="utf-8", errors="ignore")
-                            for item in user[1][1][attribute]
-                        ]
-                user_obj["dn"] = user[1][0]
-                user_obj["user"] = user[1][1]
-                users.append(user_obj)
-        return users
+            yield {"dn": dn, "user": LdapUser(attributes)}
 
     def is_special(self, sam_name, uac):
-        # list of accounts not to touch
-        disabled_codes = [
-            "514",  # Disabled Account
-            "65536",  # DONT_EXPIRE_PASSWORD
-            "66048",  # Enabled, Password Doesn’t Expire
-            "66050",  # Disabled, Password Doesn’t Expire
-            "66080",  # Disabled, Password Doesn’t Expire & Not Required
-            "262658",  # Disabled, Smartcard Required
-            "262690",  # Disabled, Smartcard Required, Password Not Required
-        ]
-        return uac in disabled_codes or fnmatch.filter(self.filter_patterns, sam_name)
-
-    @staticmethod
-    def filetime_to_dt(ft):
         """
-        Convert windowsfiletime to python datetime.
-        ref: https://gist.github.com/Mostafa-Hamdy-Elgiar/9714475f1b3bc224ea063af81566d873  # noqa: E501  # pylint: disable=line-too-long
+        Returns True for hands off accounts and accounts that are disabled
+        or have passwords that don't expire.
         """
-        # January 1, 1970 as MS file time
-        epoch_as_filetime = 116444736000000000
-        hundreds_of_nanoseconds = 10000000
-        return datetime.utcfromtimestamp(
-            (int(ft) - epoch_as_filetime) / hundreds_of_nanoseconds
+        return self.hands_off.matches(sam_name, uac)
+
+    @staticmethod
+    def dt_to_filetime(dt):
+        """Convert a naive UTC python datetime to windows filetime."""
+        return (
+            EPOCH_AS_FILETIME
+            + calendar.timegm(dt.timetuple()) * HUNDREDS_OF_NANOSECONDS
+            + dt.microsecond * 10
+        )
+
+
+def get_days_since_pwdlastset(pwdlastset_column, now_filetime):
+    """
+    Returns the number of days between now_filetime and each pwdLastSet
+    filetime of the provided column.
+
+    Users that have never set their password (pwdLastSet=0) are reported as
+    1 day. numpy is used when it is available.
+    """
+    if numpy is not None:
+        filetimes = numpy.asarray(pwdlastset_column, dtype=numpy.int64)
+        days = (now_filetime - filetimes) // FILETIME_TICKS_PER_DAY
+        days[filetimes == 0] = 1
+        return days.tolist()
+    return [
+        (now_filetime - ft) // FILETIME_TICKS_PER_DAY if ft else 1
+        for ft in pwdlastset_column
+    ]
+
+
+def build_user_filter(excluded_uac_flags=(), pwdlastset_cutoff=None):
+    """
+    Build the LDAP filter used to select candidate user objects.
+
+    Each userAccountControl flag in excluded_uac_flags is excluded server-side
+    with the LDAP_MATCHING_RULE_BIT_AND matching rule. When pwdlastset_cutoff
+    (a windows filetime) is provided only users whose password was last set
+    on or before the cutoff are returned. Users that have never set their
+    password (pwdLastSet=0) are never stale, while accounts labelled with the
+    test description are always returned.
+
+    example:
+    (&(objectCategory=person)(objectClass=user)
+      (!(userAccountControl:1.2.840.113556.1.4.803:=2))
+      (|(&(pwdLastSet>=1)(pwdLastSet<=132000000000000000))
+        (description=\\2a\\2a\\2aTEST\\2a\\2a\\2a)))
+    """
+    clauses = [USER_FILTER]
+    for flag in excluded_uac_flags:
+        clauses.append(
+            f"(!(userAccountControl:{LDAP_MATCHING_RULE_BIT_AND}:={int(flag)}))"
         )
+    if pwdlastset_cutoff is not None:
+        test_description = escape_filter_chars(TEST_DESCRIPTION)
+        clauses.append(
+            f"(|(&(pwdLastSet>=1)(pwdLastSet<={int(pwdlastset_cutoff)}))"
+            f"(description={test_description}))"
+        )
+    return f"(&{''.join(clauses)})"
+
+
+def get_sam_account_name_ranges(shard_count):
+    """
+    Returns the LDAP filter clauses splitting sAMAccountName into shard_count
+    contiguous ranges.
+
+    The ranges are split on SHARD_BOUNDARY_CHARACTERS. The first range has
+    no lower bound and the last range no upper bound, so together they cover
+    every account exactly once.
+
+    example for 2 shards:
+    ["(!(sAMAccountName>=i))", "(sAMAccountName>=i)"]
+    """
+    shard_count = min(shard_count, len(SHARD_BOUNDARY_CHARACTERS))
+    boundaries = [
+        SHARD_BOUNDARY_CHARACTERS[i * len(SHARD_BOUNDARY_CHARACTERS) // shard_count]
+        for i in range(1, shard_count)
+    ]
+    lower_bounds = [None] + boundaries
+    upper_bounds = boundaries + [None]
+    ranges = []
+    for lower, upper in zip(lower_bounds, upper_bounds):
+        clauses = ""
+        if lower:
+            clauses += f"(sAMAccountName>={lower})"
+        if upper:
+            clauses += f"(!(sAMAccountName>={upper}))"
+        ranges.append(clauses)
+    return ranges
 
 
 def get_file_name(file_name, extension):
@@ -246,127 +1052,351 @@ def get_file_name(file_name, extension):
 
 
 def create_json_doc(**content):
-    """create a table"""
+    """
+    Create the machine readable scan results.
+
+    The scan results are written as gzip compressed newline delimited json,
+    one record per user, so they can be read back one user at a time.
+    """
+
+    def write(writer):
+        with RecordWriter(writer) as records:
+            for user in content["users"]:
+                records.write(user)
+
     # This can be fleshed out to make the retrieved information
     # more user friendly if desired/required
     artifact = {}
-    artifact["content"] = json.dumps(content["users"])
-    artifact["file_name"] = get_file_name("user_expiration_table", "json")
+    artifact["write"] = write
+    artifact["file_name"] = get_file_name(
+        "user_expiration_table", SCAN_RESULTS_EXTENSION
+    )
     artifact["raw_scan_results"] = True
+    artifact["content_encoding"] = "gzip"
+    artifact["content_type"] = "application/x-ndjson"
     return artifact
 
 
-def get_html_table_headers(**content):
+@functools.lru_cache(maxsize=None)
+def get_template(template):
     """
-    Return the keys of the first element in the user_list dict.
+    Returns the compiled template, loading it on first use.
 
-    We don't care if the dict is unordered b/c the expectation is
-    that each element of the dict will be structured the same
+    Templates are loaded from COMPILED_TEMPLATES_DIR when it exists, which
+    skips parsing and compiling them during a cold start.
     """
-    user_list = content["users"]
-    days_since_pwdlastset = content["days_since_pwdlastset"]
-    try:
-        return user_list[days_since_pwdlastset][0].keys()
-    except IndexError:
-        # return the empty list of there are no accounts to be disabled
-        return []
+    if os.path.isdir(COMPILED_TEMPLATES_DIR):
+        loader = jinja2.ModuleLoader(COMPILED_TEMPLATES_DIR)
+    else:
+        loader = jinja2.FileSystemLoader(TEMPLATES_DIR, encoding="utf8")
+    return jinja2.Environment(loader=loader).get_template(template)
 
 
 def render_template(template="html_table.html", **kwargs):
-    env = Environment(
-        loader=FileSystemLoader(
-            os.path.join(os.path.dirname(__file__), "templates"), encoding="utf8"
-        )
-    )
-    template = env.get_template(template)
-    return template.render(**kwargs)
+    """Yields the rendered template in chunks."""
+    return get_template(template).generate(**kwargs)
 
 
 def create_html_table(**content):
-    # un-group the users for the html table
+    """
+    Create the human readable scan results.
+
+    The users are rendered as they are read. The user counts are rendered
+    after the table, once every user has been counted.
+    """
     template_contents = {
-        "table_headers": get_html_table_headers(**content),
+        "table_headers": HTML_TABLE_HEADERS,
         "user_list": content["users"],
+        "user_counts": content["user_counts"],
         "days_since_pwdlastset": content["days_since_pwdlastset"],
     }
+
+    def write(writer):
+        for chunk in render_template(**template_contents):
+            writer.write(chunk)
+
     artifact = {}
-    artifact["content"] = render_template(**template_contents)
+    artifact["write"] = write
     artifact["file_name"] = get_file_name("user_expiration", "html")
     return artifact
 
 
-def generate_artifacts(**content):
-    """Returns the list of objects to upload to s3"""
-    artifacts = {}
-    artifacts["user_expiration_table"] = create_json_doc(**content)
-    artifacts["user_expiration_html"] = create_html_table(**content)
-    return artifacts
+# functions creating the artifacts of a scan, keyed by artifact name
+ARTIFACT_CREATORS = {
+    "user_expiration_table": create_json_doc,
+    "user_expiration_html": create_html_table,
+}
+
+
+def generate_artifacts(users_by_artifact, **content):
+    """
+    Returns the objects to upload to s3.
+
+    Every artifact reads the stale users from its own iterable in
+    users_by_artifact, keyed by artifact name.
+    """
+    return {
+        name: create(users=users_by_artifact[name], **content)
+        for name, create in ARTIFACT_CREATORS.items()
+    }
+
+
+class ArtifactQueue:
+    """
+    Bounded queue of the batches of stale users read by an artifact.
+
+    Iterating over the queue yields the users of every batch until the queue
+    is closed.
+    """
+
+    def __init__(self, depth=ARTIFACT_QUEUE_DEPTH):
+        self.queue = queue.Queue(maxsize=depth)
+        self.closed = False
+
+    def put(self, batch):
+        """Adds a batch, blocking while the queue is full."""
+        self.queue.put(batch)
+
+    def close(self, error=None):
+        """Ends the iteration, with an error if the scan failed."""
+        self.queue.put(error)
+
+    def __iter__(self):
+        while not self.closed:
+            # waiting for the scan is not part of rendering the artifact
+            with metrics.phase("scan_wait"):
+                batch = self.queue.get()
+            if isinstance(batch, list):
+                for user in batch:
+                    yield user
+                continue
+            self.closed = True
+            if batch is not None:
+                raise RuntimeError("The scan failed before it was complete")
 
+    def drain(self):
+        """Discards the remaining batches so the scan is never blocked."""
+        while not self.closed:
+            if not isinstance(self.queue.get(), list):
+                self.closed = True
 
-def put_object(dest_bucket_name, dest_object_name, src_data):
+
+def put_object(dest_bucket_name, dest_object_name, src_data, content_encoding="utf-8"):
     """
     Add an object to an Amazon S3 bucket
     """
     # log.debug(f"destination object name: {dest_object_name}")
-    s3.put_object(
-        Bucket=dest_bucket_name,
-        ACL="private",
-        ContentEncoding="utf-8",
-        Key=dest_object_name,
-        Body=src_data,
-    )
+    with metrics.phase("upload"):
+        s3.put_object(
+            Bucket=dest_bucket_name,
+            ACL="private",
+            ContentEncoding=content_encoding,
+            Key=dest_object_name,
+            Body=src_data,
+        )
+    metrics.add("upload", bytes=len(src_data))
+
+
+class S3ArtifactWriter:
+    """
+    File-like object that streams the content written to it to s3.
+
+    Written content is buffered until a full part is available and then sent
+    as a part of a multipart upload, so at most one part is held in memory.
+    Objects smaller than a single part are sent with one put_object call.
+    """
+
+    def __init__(
+        self, bucket, key, part_size=MULTIPART_PART_SIZE, content_encoding="utf-8"
+    ):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.content_encoding = content_encoding
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def flush(self):
+        """Parts are only sent once they are full."""
+
+    def upload_part(self, body):
+        with metrics.phase("upload"):
+            self.send_part(body)
+
+    def send_part(self, body):
+        if self.upload_id is None:
+            self.upload_id = s3.create_multipart_upload(
+                Bucket=self.bucket,
+                ACL="private",
+                ContentEncoding=self.content_encoding,
+                Key=self.key,
+            )["UploadId"]
+        part_number = len(self.parts) + 1
+        response = s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        metrics.add("upload", bytes=len(body))
+
+    def close(self):
+        """Sends the remaining content and completes the upload."""
+        if self.upload_id is None:
+            put_object(self.bucket, self.key, bytes(self.buffer), self.content_encoding)
+        else:
+            if self.buffer:
+                self.upload_part(bytes(self.buffer))
+            with metrics.phase("upload"):
+                s3.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts},
+                )
+        self.buffer = bytearray()
+        log.debug("Uploaded %s bytes to %s", self.bytes_written, self.key)
+
+    def abort(self):
+        """Discards the parts that were already sent."""
+        if self.upload_id is not None:
+            s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+        self.buffer = bytearray()
 
 
-def create_presigned_url(bucket_name, object_name, expiration=3600):
+def create_presigned_url(
+    bucket_name,
+    object_name,
+    expiration=PRESIGNED_URL_EXPIRATION,
+    content_type="text/html",
+):
     return s3.generate_presigned_url(
         "get_object",
         Params={
             "Bucket": bucket_name,
             "Key": object_name,
-            "ResponseContentType": "text/html",
+            "ResponseContentType": content_type,
         },
         ExpiresIn=expiration,
     )
 
 
 def upload_artifact(artifact):
-    """Uploads an artifact to s3 and generates a presigned url
+    """Streams an artifact to s3 and generates a presigned url
 
     Arguments:
         artifact {dict} -- dictionary containing the artifact's
-        contents and file name
+        file name and a function that writes its contents to a
+        file-like object
 
     Returns:
         dict -- dictionary containing the object name and presigned url
     """
     bucket_name = os.environ["ARTIFACTS_BUCKET"]
     log.debug("Uploading object: %s to %s", artifact["file_name"], bucket_name)
-    put_object(bucket_name, artifact["file_name"], artifact["content"].encode("utf-8"))
-    presigned_url = create_presigned_url(bucket_name, artifact["file_name"])
+    with S3ArtifactWriter(
+        bucket_name,
+        artifact["file_name"],
+        content_encoding=artifact.get("content_encoding", "utf-8"),
+    ) as writer:
+        with metrics.phase("render"):
+            artifact["write"](writer)
+        metrics.add("render", entries=1, bytes=writer.bytes_written)
+    expires_at = int(time.time()) + PRESIGNED_URL_EXPIRATION
+    presigned_url = create_presigned_url(
+        bucket_name,
+        artifact["file_name"],
+        content_type=artifact.get("content_type", "text/html"),
+    )
     is_raw_scan_result = False
     if artifact.get("raw_scan_results"):
         is_raw_scan_result = True
     return {
         "file_name": artifact["file_name"],
         "url": presigned_url,
+        "expires_at": expires_at,
         "raw_scan_results": is_raw_scan_result,
     }
 
 
-def upload_all_artifacts(**content):
-    artifacts = generate_artifacts(**content)
-    log.debug("generated artifacts: %s", artifacts)
-    response = []
-    for artifact in artifacts:
-        response.append(upload_artifact(artifacts[artifact]))
-    return response
+def upload_queued_artifact(artifact, artifact_queue):
+    """Uploads an artifact that reads its users from an ArtifactQueue."""
+    try:
+        return upload_artifact(artifact)
+    finally:
+        # a failed upload must not block the other artifacts
+        artifact_queue.drain()
 
 
-def get_user_counts(users):
-    response = {}
-    for key in users:
-        response[key] = len(users[key])
-    return response
+def upload_all_artifacts(**content):
+    """
+    Generates, uploads and presigns the artifacts concurrently, so the time
+    taken is that of the slowest artifact rather than the sum of all of them.
+
+    content["users"] is an iterable of batches of stale users, e.g. from
+    LdapMaintainer.iter_stale_users. Every batch is handed to each artifact
+    through its own ArtifactQueue, so the scan, the rendering and the
+    uploads run as one pipeline and no more than ARTIFACT_QUEUE_DEPTH
+    batches are held per artifact, whatever the size of the directory.
+    """
+    batches = content.pop("users")
+    queues = {name: ArtifactQueue() for name in ARTIFACT_CREATORS}
+    artifacts = generate_artifacts(queues, **content)
+    log.debug("generated artifacts: %s", list(artifacts))
+    # every artifact must be read concurrently for the queues to drain
+    with ThreadPoolExecutor(max_workers=len(artifacts)) as executor:
+        futures = [
+            executor.submit(upload_queued_artifact, artifacts[name], queues[name])
+            for name in artifacts
+        ]
+        error = None
+        try:
+            for batch in batches:
+                if not batch:
+                    continue
+                with metrics.phase("artifact_wait"):
+                    for artifact_queue in queues.values():
+                        artifact_queue.put(batch)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            for artifact_queue in queues.values():
+                artifact_queue.close(error)
+        return [future.result() for future in futures]
+
+
+def count_users(batches, user_counts):
+    """Counts the users of each threshold as the batches are yielded."""
+    for batch in batches:
+        for user in batch:
+            user_counts[user["days_since_pwdlastset"]] += 1
+        yield batch
 
 
 def retrieve_s3_object_contents(s3_obj, bucket=os.environ["ARTIFACTS_BUCKET"]):
@@ -375,24 +1405,208 @@ def retrieve_s3_object_contents(s3_obj, bucket=os.environ["ARTIFACTS_BUCKET"]):
     )
 
 
+def get_scan_state_key(ldaps_url):
+    """Returns the s3 key of the incremental scan state of the target DC."""
+    return f"{SCAN_STATE_PREFIX}/{urlparse(ldaps_url).hostname}.json"
+
+
+def get_snapshot_key(ldaps_url):
+    """Returns the s3 key of the incremental scan snapshot of the target DC."""
+    hostname = urlparse(ldaps_url).hostname
+    return f"{SCAN_STATE_PREFIX}/{hostname}.{SCAN_RESULTS_EXTENSION}"
+
+
+def get_scan_state(bucket, key):
+    """Returns the stored incremental scan state or None if there isn't one."""
+    try:
+        return retrieve_s3_object_contents(key, bucket=bucket)
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def incremental_scan(ldap_maintainer, bucket=os.environ["ARTIFACTS_BUCKET"]):
+    """
+    Yields every active user of the directory while only reading the
+    entries that changed since the previous scan.
+
+    The snapshot of the active users is stored in s3 as gzip compressed
+    ndjson and is read, merged with the changed entries and written back one
+    user at a time. The scan state holds the highestCommittedUSN of the DC at
+    the time of the scan and a hash of the configuration deciding which users
+    are kept. uSNChanged values are local to a DC, so a full scan is performed
+    when there is no state, the ldaps url resolved to a different DC or the
+    configuration changed.
+    """
+    root_dse = ldap_maintainer.read_root_dse(["dsServiceName", "highestCommittedUSN"])
+    state_key = get_scan_state_key(ldap_maintainer.ldaps_url)
+    snapshot_key = get_snapshot_key(ldap_maintainer.ldaps_url)
+    config_hash = ldap_maintainer.get_scan_config_hash()
+    with metrics.phase("incremental_scan"):
+        state = get_scan_state(bucket, state_key) or {}
+
+    if (
+        state.get("dsServiceName") == root_dse["dsServiceName"]
+        and state.get("config_hash") == config_hash
+        and state.get("snapshot") == snapshot_key
+    ):
+        users = merge_snapshot(
+            ldap_maintainer, bucket, snapshot_key, state["highestCommittedUSN"]
+        )
+    else:
+        log.info("No usable scan state found, performing a full scan")
+        users = (
+            dict(user_obj["user"])
+            for user_obj in ldap_maintainer.get_snapshot_users()
+            if ldap_maintainer.is_candidate(user_obj["user"])
+        )
+
+    # the new snapshot replaces the previous one once it has been read
+    with S3ArtifactWriter(bucket, snapshot_key, content_encoding="gzip") as writer:
+        with RecordWriter(writer) as records:
+            for user in users:
+                records.write(user)
+                yield user
+    metrics.add("incremental_scan", entries=records.records_written)
+
+    state = {
+        "dsServiceName": root_dse["dsServiceName"],
+        "highestCommittedUSN": root_dse["highestCommittedUSN"],
+        "config_hash": config_hash,
+        "snapshot": snapshot_key,
+    }
+    put_object(bucket, state_key, json.dumps(state).encode("utf-8"))
+
+
+def merge_snapshot(ldap_maintainer, bucket, snapshot_key, usn):
+    """
+    Yields the users of the stored snapshot merged with the objects changed
+    since the provided uSNChanged value.
+
+    Only the changed objects are held in memory. Every user is checked with
+    is_candidate before it is yielded, stored users included.
+    """
+    log.info("Performing incremental scan from uSNChanged %s", usn)
+    with metrics.phase("incremental_scan"):
+        changed = {
+            user_obj["user"]["objectGUID"][0]: dict(user_obj["user"])
+            for user_obj in ldap_maintainer.get_changed_users(usn)
+        }
+        removed = set(ldap_maintainer.get_removed_users(usn))
+    for guid in removed:
+        changed.pop(guid, None)
+    log.info(
+        "Merging %s changed and %s removed objects into the scan snapshot",
+        len(changed),
+        len(removed),
+    )
+    for user in iter_scan_results(s3, bucket, snapshot_key):
+        guid = user["objectGUID"][0]
+        if guid in removed:
+            continue
+        user = changed.pop(guid, user)
+        if ldap_maintainer.is_candidate(user):
+            yield user
+    # users created since the previous scan
+    for user in changed.values():
+        if ldap_maintainer.is_candidate(user):
+            yield user
+
+
+def write_report_manifest(artifacts, user_counts):
+    """
+    Points the latest report manifest at the artifacts of this query.
+
+    The manifest holds the presigned urls of the artifacts along with the
+    time they expire, so they can be reused until then.
+    """
+    manifest = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "totals": user_counts,
+    }
+    for artifact in artifacts:
+        if artifact["raw_scan_results"]:
+            manifest["scan_results"] = artifact
+        else:
+            manifest["report"] = artifact
+    put_object(
+        os.environ["ARTIFACTS_BUCKET"],
+        LATEST_REPORT_MANIFEST,
+        json.dumps(manifest).encode("utf-8"),
+    )
+    log.debug("Updated %s: %s", LATEST_REPORT_MANIFEST, manifest)
+
+
 def query_handler(ldap_config, event):
     """Handles query events"""
-    ldap_config["users"] = LdapMaintainer(**ldap_config).get_stale_users()
-    log.debug("Ldap query results: %s", ldap_config["users"])
+    ldap_maintainer = LdapMaintainer(**ldap_config)
+    users = None
+    if os.environ.get("INCREMENTAL_SCAN", "false").lower() == "true":
+        users = incremental_scan(ldap_maintainer)
+    # the users are scanned, classified and written to the artifacts
+    # a batch at a time, the counts are complete once the artifacts are
+    user_counts = {f"{threshold}": 0 for threshold in ldap_maintainer.thresholds}
+    ldap_config["users"] = count_users(
+        ldap_maintainer.iter_stale_users(users), user_counts
+    )
+    ldap_config["user_counts"] = user_counts
+    artifacts = upload_all_artifacts(**ldap_config)
+    log.info("Ldap query totals: %s", user_counts)
+    write_report_manifest(artifacts, user_counts)
     return {
-        "query_results": {"totals": get_user_counts(ldap_config["users"])},
-        "artifacts": upload_all_artifacts(**ldap_config),
+        "query_results": {"totals": user_counts},
+        "artifacts": artifacts,
     }
 
 
 def disable_handler(ldap_config, event):
     """Handles disable events"""
-    ldap_config["users_to_disable"] = retrieve_s3_object_contents(
-        event["ldap_scan_results"]
-    )[ldap_config["days_since_pwdlastset"]]
-    log.info("Disabling the following users: %s", ldap_config["users_to_disable"])
-    LdapMaintainer(**ldap_config).disable_users()
-    log.info("Users successfully disabled")
+    ldap_config["users_to_disable"] = iter_users_to_disable(
+        s3,
+        os.environ["ARTIFACTS_BUCKET"],
+        event["ldap_scan_results"],
+        ldap_config["days_since_pwdlastset"],
+    )
+    log.info("Disabling the users in %s", event["ldap_scan_results"])
+    results = LdapMaintainer(**ldap_config).disable_users()
+    log.info("Successfully disabled %s users", results["disabled"])
+    if results["failed"]:
+        # every user has been attempted, failing the task reports the error
+        raise RuntimeError(
+            f"Failed to disable {results['failed']} of "
+            f"{results['disabled'] + results['failed']} users, "
+            f"e.g. {results['failure_sample']}"
+        )
+    event["disable_results"] = results
+    return event
+
+
+def ldif_handler(ldap_config, event):
+    """
+    Handles get_ldif events, streaming the LDIF change records that disable
+    the users in the provided scan results to s3
+    """
+    users_to_disable = iter_users_to_disable(
+        s3,
+        os.environ["ARTIFACTS_BUCKET"],
+        event["ldap_scan_results"],
+        ldap_config["days_since_pwdlastset"],
+    )
+    log.info("Exporting the users in %s as ldif", event["ldap_scan_results"])
+    # the export is made from the scan results only, so it doesn't depend
+    # on the DC being reachable
+    modlist = LdapMaintainer.get_disable_modlist()
+    records = {}
+
+    def write(writer):
+        records["written"] = LdapMaintainer.get_ldif(users_to_disable, modlist, writer)
+
+    artifact = {}
+    artifact["write"] = write
+    artifact["file_name"] = get_file_name("user_disable", "ldif")
+    artifact["content_type"] = "text/plain"
+    event["ldif"] = upload_artifact(artifact)
+    event["ldif"]["records"] = records["written"]
+    log.info("Exported %s users to %s", records["written"], artifact["file_name"])
     return event
 
 
@@ -400,9 +1614,10 @@ def handler(event, context):  # pylint: disable=unused-argument
     """
     expected event:
     {
-        "action": "query" | "disable"
+        "action": "query" | "disable" | "get_ldif"
     }
     """
+    metrics.reset()
     log.info("Received event: %s", event)
     if event.get("Payload"):
         event = event["Payload"]
@@ -421,8 +1636,22 @@ def handler(event, context):  # pylint: disable=unused-argument
         "svc_user_pwd": svc_user_pwd,
         "filter_patterns": json.loads(os.environ["HANDS_OFF_ACCOUNTS"]),
         "days_since_pwdlastset": os.environ["DAYS_SINCE_PWDLASTSET"],
+        "page_size": os.environ.get("SEARCH_PAGE_SIZE", DEFAULT_PAGE_SIZE),
+        "modify_window": os.environ.get("MODIFY_WINDOW", DEFAULT_MODIFY_WINDOW),
+        "search_bases": json.loads(os.environ.get("SEARCH_BASES", "[]")),
+        "scan_shards": os.environ.get("SCAN_SHARDS", 1),
+        "report_thresholds": json.loads(os.environ.get("REPORT_THRESHOLDS", "[]")),
     }
 
-    strategy = {"query": query_handler, "disable": disable_handler}
+    strategy = {
+        "query": query_handler,
+        "disable": disable_handler,
+        "get_ldif": ldif_handler,
+    }
 
-    return strategy[event["action"]](ldap_config, event)
+    try:
+        return strategy[event["action"]](ldap_config, event)
+    finally:
+        metrics.flush(event["action"])
+        log_event(log, logging.INFO, "ldap operations", **ldap_retrier.stats.as_dict())
+        ldap_retrier.stats.reset()
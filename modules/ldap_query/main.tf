@@ -28,7 +28,10 @@ data "aws_iam_policy_document" "lambda" {
       "s3:List*",
       "s3:PutObject"
     ]
-    resources = [data.aws_s3_bucket.artifacts.arn]
+    resources = [
+      data.aws_s3_bucket.artifacts.arn,
+      "${data.aws_s3_bucket.artifacts.arn}/*"
+    ]
   }
 }
 
@@ -114,6 +117,13 @@ module "lambda" {
       ARTIFACTS_BUCKET      = var.artifacts_bucket_name
       HANDS_OFF_ACCOUNTS    = jsonencode(local.hands_off_accounts)
       DAYS_SINCE_PWDLASTSET = var.days_since_pwdlastset
+      SEARCH_PAGE_SIZE      = var.search_page_size
+      INCREMENTAL_SCAN      = var.enable_incremental_scan
+      MODIFY_WINDOW         = var.modify_window
+      SEARCH_BASES          = jsonencode(var.search_bases)
+      SCAN_SHARDS           = var.scan_shards
+      REPORT_THRESHOLDS     = jsonencode(var.report_thresholds)
+      METRICS_NAMESPACE     = var.project_name
     }
   }
 
@@ -122,5 +132,5 @@ module "lambda" {
     security_group_ids = [aws_security_group.lambda.id]
   }
 
-  layers = [module.lambda_layer.this_lambda_layer_arn]
+  layers = [module.lambda_layer.this_lambda_layer_arn, var.common_layer_arn]
 }
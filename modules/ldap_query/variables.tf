@@ -57,3 +57,44 @@ variable "days_since_pwdlastset" {
   type        = number
   default     = 120
 }
+
+variable "search_page_size" {
+  description = "Number of entries requested per page when searching the directory with the simple paged results control"
+  type        = number
+  default     = 1000
+}
+
+variable "enable_incremental_scan" {
+  description = "Only read the directory entries that changed since the previous query, using uSNChanged high-water marks stored in the artifacts bucket"
+  type        = bool
+  default     = false
+}
+
+variable "modify_window" {
+  description = "Maximum number of asynchronous modify requests kept outstanding while disabling users"
+  type        = number
+  default     = 50
+}
+
+variable "search_bases" {
+  description = "Distinguished names of the OUs searched concurrently, on separate connections, instead of domain_base_dn. The OUs must not be nested."
+  type        = list(string)
+  default     = []
+}
+
+variable "scan_shards" {
+  description = "Number of sAMAccountName ranges each search base is split into and searched concurrently, on separate connections"
+  type        = number
+  default     = 1
+}
+
+variable "report_thresholds" {
+  description = "Additional numbers of days since the pwdLastSet ldap attribute has been updated that users are grouped by in the scan results. Only the users of days_since_pwdlastset and greater thresholds are disabled."
+  type        = list(number)
+  default     = []
+}
+
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
@@ -3,53 +3,35 @@
 Slack chat-bot Lambda handler.
 """
 
-import boto3
-import collections
 import json
-import logging
 import os
 import random
 import re
 import string
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import parse_qs
 
-import slack
-
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
-)
-
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for handler in root.handlers:
-        root.removeHandler(handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "slack_listener.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
-)
-log = logging.getLogger(__name__)
-
-
-slack_client = slack.WebClient(token=os.environ["SLACK_API_TOKEN"])
-s3 = boto3.client("s3")
-sfn = boto3.client("stepfunctions")
+from ldap_maintainer_common.lazy import Lazy, lazy_client, lazy_import
+from ldap_maintainer_common.logs import configure_logging
+from ldap_maintainer_common.scan_results import LATEST_REPORT_MANIFEST
+
+log = configure_logging(__name__, "slack_listener.log")
+
+
+# the clients are created on first use, so requests that do not need them
+# (e.g. the url verification challenge) are answered without loading them
+slack = lazy_import("slack")
+slack_client = Lazy(lambda: slack.WebClient(token=os.environ["SLACK_API_TOKEN"]))
+s3 = lazy_client("s3")
+sfn = lazy_client("stepfunctions")
+lambda_client = lazy_client("lambda")
+
+# presigned urls of the manifest are reused until they are about to expire
+PRESIGNED_URL_MARGIN = 300
+# executions stopped concurrently, within the default boto3 connection pool
+MAX_STOP_WORKERS = 8
 
 
 def get_http_response(httpStatusCode, body=None, headers={}):
@@ -72,21 +54,46 @@ def start_sfn(
     )
 
 
-def get_sfn_status(sfn_arn=os.environ["SFN_ARN"]):
-    return sfn.list_executions(
-        stateMachineArn=sfn_arn, statusFilter="RUNNING", maxResults=0
+def get_running_executions(sfn_arn=os.environ["SFN_ARN"]):
+    """Yields every running execution of the state machine, page by page."""
+    paginator = sfn.get_paginator("list_executions")
+    for page in paginator.paginate(stateMachineArn=sfn_arn, statusFilter="RUNNING"):
+        for execution in page["executions"]:
+            yield execution
+
+
+def stop_execution(execution_arn):
+    sfn.stop_execution(
+        executionArn=execution_arn,
+        error="Slackbot stop",
+        cause="Stop execution event initiated from slack",
     )
 
 
 def stop_sfn():
-    running_sfns = get_sfn_status()["executions"]
-    for running_sfn in running_sfns:
-        execution_arn = running_sfn["executionArn"]
-        sfn.stop_execution(
-            executionArn=execution_arn,
-            error="Slackbot stop",
-            cause="Stop execution event initiated from slack",
-        )
+    """
+    Stops every running execution of the state machine, up to
+    MAX_STOP_WORKERS at a time.
+
+    Returns:
+        dict -- number of executions that were stopped and that failed to stop
+    """
+    results = {"stopped": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=MAX_STOP_WORKERS) as executor:
+        futures = {}
+        for execution in get_running_executions():
+            execution_arn = execution["executionArn"]
+            futures[executor.submit(stop_execution, execution_arn)] = execution_arn
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                log.error("Failed to stop %s: %s", futures[future], e)
+                results["failed"] += 1
+            else:
+                results["stopped"] += 1
+    log.info("Stop results: %s", results)
+    return results
 
 
 def get_last_modified():
@@ -98,10 +105,26 @@ def get_latest_s3_object(
 ):
     """
     Retrieve the newest object in the target s3 bucket
+
+    Every page of the listing is read, so this takes time proportional to the
+    number of objects. Only used when there is no latest report manifest.
     """
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    all = response["Contents"]
-    return max(all, key=lambda x: x["LastModified"])
+    paginator = s3.get_paginator("list_objects_v2")
+    latest = None
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if latest is None or obj["LastModified"] > latest["LastModified"]:
+                latest = obj
+    return latest
+
+
+def get_report_manifest(bucket=os.environ["ARTIFACTS_BUCKET"]):
+    """Returns the latest report manifest, or None if there is none yet."""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=LATEST_REPORT_MANIFEST)["Body"]
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(body.read().decode("utf-8"))
 
 
 def create_presigned_url(bucket_name, object_name, expiration=3600):
@@ -117,12 +140,30 @@ def create_presigned_url(bucket_name, object_name, expiration=3600):
 
 
 def get_user_report():
-    latest_user_expiration_report = get_latest_s3_object()
-    log.debug("latest user expiration report object: %s", latest_user_expiration_report)
-    url = create_presigned_url(
-        os.environ["ARTIFACTS_BUCKET"], latest_user_expiration_report["Key"]
-    )
-    return f'latest report: <{url}|{latest_user_expiration_report["Key"]}>'
+    """
+    Returns a link to the latest user report.
+
+    The report is resolved with a single read of the latest report manifest,
+    whose presigned url is reused while it is valid. Buckets without a
+    manifest are listed instead.
+    """
+    manifest = get_report_manifest()
+    log.debug("latest report manifest: %s", manifest)
+    if manifest and manifest.get("report"):
+        key = manifest["report"]["file_name"]
+        url = manifest["report"]["url"]
+        if manifest["report"]["expires_at"] - time.time() > PRESIGNED_URL_MARGIN:
+            return f"latest report: <{url}|{key}>"
+    else:
+        latest_user_expiration_report = get_latest_s3_object()
+        log.debug(
+            "latest user expiration report object: %s", latest_user_expiration_report
+        )
+        if latest_user_expiration_report is None:
+            return "No user report has been generated yet"
+        key = latest_user_expiration_report["Key"]
+    url = create_presigned_url(os.environ["ARTIFACTS_BUCKET"], key)
+    return f"latest report: <{url}|{key}>"
 
 
 def message_check(pattern, message_string, flags=re.IGNORECASE):
@@ -130,11 +171,30 @@ def message_check(pattern, message_string, flags=re.IGNORECASE):
     return message_check.search(message_string)
 
 
+def post_to_response_url(response_url, bot_text, ephemeral):
+    """Responds to a slash command through its response url."""
+    body = {
+        "response_type": "ephemeral" if ephemeral else "in_channel",
+        "text": bot_text,
+    }
+    request = urllib.request.Request(
+        response_url,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+
 def send_slack_message(message, bot_text):
     user = message["user"]
     channel = message["channel"]
 
-    if message.get("ephemeral"):
+    if message.get("response_url"):
+        post_to_response_url(
+            message["response_url"], bot_text, message.get("ephemeral")
+        )
+    elif message.get("ephemeral"):
         slack_client.chat_postEphemeral(channel=channel, text=bot_text, user=user)
     else:
         slack_client.chat_postMessage(channel=channel, text=bot_text)
@@ -174,8 +234,10 @@ def slack_message_handler(message):
         """
 
     if message_check("(?:cancel|stop)", text):
-        stop_sfn()
-        bot_text = "Current run cancelled"
+        results = stop_sfn()
+        bot_text = f"Cancelled {results['stopped']} running executions"
+        if results["failed"]:
+            bot_text += f", {results['failed']} could not be cancelled"
 
     if message_check("(?:start|run)", text):
         start_sfn()
@@ -188,9 +250,38 @@ def slack_message_handler(message):
     return get_http_response(200)
 
 
+def is_slack_retry(event):
+    """Returns True if slack is resending a request it already sent."""
+    headers = event.get("headers") or {}
+    return any(key.lower() == "x-slack-retry-num" for key in headers)
+
+
+def defer_slack_message(message):
+    """
+    Hands the message off to an asynchronous invocation of this function, so
+    slack can be answered before the command is run.
+    """
+    lambda_client.invoke(
+        FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+        InvocationType="Event",
+        Payload=json.dumps({"deferred_message": message}),
+    )
+
+
 def handler(event, context):
     log.debug("received event: %s", event)
 
+    if event.get("deferred_message"):
+        # invoked by defer_slack_message, the result is posted to slack
+        return slack_message_handler(event["deferred_message"])
+
+    deferred_commands = os.environ.get("DEFERRED_COMMANDS", "false").lower() == "true"
+    if deferred_commands and is_slack_retry(event):
+        # the first attempt was acknowledged and its command deferred. When
+        # commands are run synchronously, a retry follows a real timeout
+        log.debug("Ignoring a retried slack request.")
+        return get_http_response(200)
+
     try:
         slack_message = json.loads(event["body"])
     except TypeError:
@@ -216,4 +307,8 @@ def handler(event, context):
             log.debug("Received bot's own message. ignoring..")
             return get_http_response(200)
 
+    if deferred_commands:
+        defer_slack_message(slack_message)
+        return get_http_response(200)
+
     return slack_message_handler(slack_message)
@@ -1,3 +1,6 @@
+data "aws_region" "current" {}
+data "aws_caller_identity" "current" {}
+
 resource "random_string" "this" {
   length  = 8
   special = false
@@ -6,6 +9,9 @@ resource "random_string" "this" {
 
 locals {
   sfn_execution_arn = "${replace(var.step_function_arn, "stateMachine", "execution")}:*"
+  function_name     = "${var.project_name}-slack-bot-${random_string.this.result}"
+  # built from the name, the policy can't refer to the function it is attached to
+  function_arn = "arn:aws:lambda:${data.aws_region.current.region}:${data.aws_caller_identity.current.account_id}:function:${local.function_name}"
 }
 
 data "aws_s3_bucket" "artifacts" {
@@ -30,14 +36,23 @@ data "aws_iam_policy_document" "lambda" {
       "s3:Get*",
       "s3:List*"
     ]
-    resources = [data.aws_s3_bucket.artifacts.arn]
+    resources = [
+      data.aws_s3_bucket.artifacts.arn,
+      "${data.aws_s3_bucket.artifacts.arn}/*"
+    ]
+  }
+
+  statement {
+    sid       = "AllowDeferredCommands"
+    actions   = ["lambda:InvokeFunction"]
+    resources = [local.function_arn]
   }
 }
 
 module "lambda" {
   source = "github.com/claranet/terraform-aws-lambda"
 
-  function_name = "${var.project_name}-slack-bot-${random_string.this.result}"
+  function_name = local.function_name
   description   = "Responds to slack mentions of the bot user."
   handler       = "lambda.handler"
   runtime       = "python3.7"
@@ -52,11 +67,20 @@ module "lambda" {
       ARTIFACTS_BUCKET     = var.artifacts_bucket_name
       SLACK_API_TOKEN      = var.slack_api_token
       SLACK_SIGNING_SECRET = var.slack_signing_secret
+      DEFERRED_COMMANDS    = var.enable_deferred_commands
     }
   }
 
   policy = data.aws_iam_policy_document.lambda
 
+  layers = [var.common_layer_arn]
+
+}
+
+# deferred commands such as start must not be run twice
+resource "aws_lambda_function_event_invoke_config" "this" {
+  function_name          = module.lambda.function_name
+  maximum_retry_attempts = 0
 }
 
 module "api_gateway" {
@@ -10,6 +10,12 @@ variable "slack_api_token" {
   default     = ""
 }
 
+variable "enable_deferred_commands" {
+  description = "Acknowledge slack commands immediately and run them in an asynchronous invocation of the function, which posts the result back to slack"
+  type        = bool
+  default     = true
+}
+
 variable "log_level" {
   default     = "Info"
   description = "Log level of the lambda output, one of: Debug, Info, Warning, Error, or Critical"
@@ -53,3 +59,8 @@ variable "artifacts_bucket_name" {
   description = "Name of the artifacts bucket"
   type        = string
 }
+
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
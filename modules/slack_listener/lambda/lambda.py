@@ -3,53 +3,25 @@
 Slack chat-bot Lambda handler.
 """
 
-import boto3
-import collections
 import json
 import os
 import hmac
 import hashlib
-import logging
 from urllib.parse import unquote_plus
 from datetime import datetime
 
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
-)
-
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for handler in root.handlers:
-        root.removeHandler(handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "slack_listener.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
-)
-log = logging.getLogger(__name__)
+from ldap_maintainer_common.lazy import lazy_client
+from ldap_maintainer_common.logs import configure_logging
+
+log = configure_logging(__name__, "slack_listener.log")
 
 # Set global defaults
 SLACK_SIGNING_SECRET = os.environ["SLACK_SIGNING_SECRET"]
 SLACK_BOT_TOKEN = os.environ["SLACK_API_TOKEN"]
 SLACK_URL = "https://slack.com/api/chat.postMessage"
 
-s3 = boto3.client("s3")
+s3 = lazy_client("s3")
+sfn = lazy_client("stepfunctions")
 
 
 def get_http_response(httpStatusCode, body, headers={}):
@@ -84,7 +56,6 @@ def notify_stepfunction(message, task_token):
     """Sends a task token to the step function service and sets the
     slack response as the output of the sfn task waiting on the token
     """
-    sfn = boto3.client("stepfunctions")
     log.debug("Sending message to stepfunctions")
     response = sfn.send_task_success(taskToken=task_token, output=json.dumps(message))
     log.debug("Received response from stepfunctions: %s", response)
@@ -135,7 +106,6 @@ def put_object(dest_bucket_name, dest_object_name, src_data):
         return False
 
     # Put the object
-    s3 = boto3.client("s3")
     try:
         s3.put_object(
             Bucket=dest_bucket_name,
@@ -53,4 +53,6 @@ module "lambda" {
 
   policy = data.aws_iam_policy_document.lambda
 
+  layers = [var.common_layer_arn]
+
 }
@@ -42,3 +42,8 @@ variable "artifacts_bucket_name" {
   description = "Name of the artifacts bucket"
   type        = string
 }
+
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
@@ -1,52 +1,23 @@
 # pylint: skip-file
-import boto3
-import collections
-import dateutil.tz
 import json
-import logging
 import os
 from datetime import datetime
 
-import slack
-
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
-)
-
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for handler in root.handlers:
-        root.removeHandler(handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "slack_notifier.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
-)
-log = logging.getLogger(__name__)
+from ldap_maintainer_common.lazy import Lazy, lazy_client, lazy_import
+from ldap_maintainer_common.logs import configure_logging
+
+log = configure_logging(__name__, "slack_notifier.log")
 
 
 SLACK_API_TOKEN = os.environ["SLACK_API_TOKEN"]
-s3 = boto3.client("s3")
+s3 = lazy_client("s3")
+dateutil_tz = lazy_import("dateutil.tz")
+slack = lazy_import("slack")
+slack_client = Lazy(lambda: slack.WebClient(token=SLACK_API_TOKEN))
 
 
 def get_time():
-    eastern = dateutil.tz.gettz(os.environ["TIMEZONE"])
+    eastern = dateutil_tz.gettz(os.environ["TIMEZONE"])
     return datetime.now(tz=eastern).strftime("%m/%d/%Y, %H:%M:%S")
 
 
@@ -112,12 +83,25 @@ class SlackMessageBuilder:
             ],
         }
 
+    def _get_user_counts_text(self):
+        """One line per staleness threshold, in ascending order of days."""
+        thresholds = sorted(int(threshold) for threshold in self.user_counts)
+        text = ""
+        for threshold, next_threshold in zip(thresholds, thresholds[1:] + [None]):
+            if next_threshold is None:
+                text += f"\n\t greater than {threshold} days:"
+            else:
+                text += f"\n\t {threshold} to {next_threshold} days:"
+            text += f" {self.user_counts[str(threshold)]}"
+            if threshold >= int(self.days_since_pwdlastset):
+                text += " (disabled on approval)"
+        return text
+
     def _get_artifact_urls_block(self):
         text = (
             f"Total counts of users with passwords"
             f" that have not been changed in.."
-            f"\n\t greater than {self.days_since_pwdlastset} days:"
-            f" {self.user_counts[str(self.days_since_pwdlastset)]}"
+            f"{self._get_user_counts_text()}"
         )
         human_readable = ""
         machine_readable = ""
@@ -221,8 +205,7 @@ def build_slack_response_message(original_blocks, msg):
 
 
 def send_updated_message_to_slack(channel_id, timestamp, message_blocks):
-    client = slack.WebClient(token=SLACK_API_TOKEN)
-    response = client.chat_update(
+    response = slack_client.chat_update(
         channel=channel_id, ts=timestamp, blocks=message_blocks
     )
     log.debug("Received response from slack: %s", response)
@@ -231,8 +214,7 @@ def send_updated_message_to_slack(channel_id, timestamp, message_blocks):
 
 def send_message_to_slack(message):
     """Sends the user status report to slack."""
-    client = slack.WebClient(token=SLACK_API_TOKEN)
-    response = client.chat_postMessage(**message)
+    response = slack_client.chat_postMessage(**message)
     assert response["ok"]
 
 
@@ -258,7 +240,7 @@ def retrieve_s3_object_contents(s3_obj, bucket=os.environ["ARTIFACTS_BUCKET"]):
 
 
 def handler(event, context):
-    log.debug("Received event: %s", json.dumps(event))
+    log.debug("Received event: %s", event)
     if event.get("message_to_slack"):
         message = event["message_to_slack"]
         response = retrieve_s3_object_contents(event["slack_message_key"])
@@ -58,3 +58,8 @@ variable "days_since_pwdlastset" {
   type        = number
   default     = 120
 }
+
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
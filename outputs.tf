@@ -12,3 +12,8 @@ output "python_ldap_layer_arn" {
   description = "ARN of the python-ldap layer"
   value       = module.ldap_query_lambda.python_ldap_layer_arn
 }
+
+output "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  value       = module.common_layer.layer_arn
+}
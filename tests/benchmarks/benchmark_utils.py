@@ -0,0 +1,78 @@
+# pylint: skip-file
+"""Helpers shared by the benchmarks"""
+
+import importlib.util
+import os
+import resource
+import sys
+import tempfile
+
+MODULES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "modules"
+)
+LDAP_QUERY_PATH = os.path.join(MODULES_DIR, "ldap_query", "lambda", "lambda.py")
+# contents of the layer shared by the lambdas
+COMMON_LAYER_PATH = os.path.join(MODULES_DIR, "common_layer", "python")
+
+
+def load_lambda(path, name, environment=None):
+    """Import a lambda module from its source file without deploying it."""
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("LOG_LEVEL", "critical")
+    if COMMON_LAYER_PATH not in sys.path:
+        sys.path.insert(0, COMMON_LAYER_PATH)
+    for key, value in (environment or {}).items():
+        os.environ.setdefault(key, value)
+    cwd = os.getcwd()
+    # the lambdas write their log file to the working directory when run locally
+    os.chdir(tempfile.mkdtemp())
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def load_ldap_query():
+    """Import the LDAP Query lambda module."""
+    return load_lambda(LDAP_QUERY_PATH, "ldap_query", {"ARTIFACTS_BUCKET": "benchmark"})
+
+
+def peak_rss_mib():
+    """Peak resident set size of the current process (linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class NullS3:
+    """s3 client stand-in that discards uploaded content."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.bytes_uploaded = 0
+
+    def put_object(self, Body=b"", **kwargs):
+        self.bytes_uploaded += len(Body)
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, Body=b"", PartNumber=1, **kwargs):
+        self.bytes_uploaded += len(Body)
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def abort_multipart_upload(self, **kwargs):
+        pass
+
+    def get_object(self, **kwargs):
+        raise self.exceptions.NoSuchKey()
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return "https://example.com/presigned"
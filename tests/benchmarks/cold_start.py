@@ -0,0 +1,112 @@
+"""Lambda cold start benchmark
+
+Measures the initialization of each lambda function: the time taken to import
+its module in a fresh interpreter, as a cold start would, and which of the
+heavy third party modules were loaded by it. Where a function has a request
+that needs no AWS or Slack calls, the latency of that first request is
+measured too, e.g. the url verification challenge of the Slack bot. The
+reported times are the median of the repetitions.
+
+usage: python cold_start.py [--functions slack_bot ...] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import benchmark_utils
+
+HEAVY_MODULES = ["boto3", "botocore", "jinja2", "slack", "dateutil"]
+ENVIRONMENT = {
+    "ARTIFACTS_BUCKET": "benchmark",
+    "DAYS_SINCE_PWDLASTSET": "120",
+    "DYNAMODB_TABLE": "benchmark",
+    "INVOKE_BASE_URL": "https://example.com",
+    "SFN_ARN": "arn:aws:states:us-east-1:123456789012:stateMachine:benchmark",
+    "SLACK_API_TOKEN": "xoxb-benchmark",
+    "SLACK_CHANNEL_ID": "C0000000000",
+    "SLACK_SIGNING_SECRET": "benchmark",
+    "TIMEZONE": "US/Eastern",
+}
+FUNCTIONS = {
+    "ldap_query": ("ldap_query/lambda/lambda.py", None),
+    "slack_bot": (
+        "slack_bot/lambda/lambda.py",
+        {"body": json.dumps({"challenge": "benchmark"})},
+    ),
+    "slack_listener": ("slack_listener/lambda/lambda.py", None),
+    "slack_notifier": ("slack_notifier/lambda/lambda.py", None),
+    "dynamodb_cleanup": ("dynamodb_cleanup/lambda.py", None),
+}
+
+
+def run_function(function):
+    """Initializes a single function in the current process."""
+    path, event = FUNCTIONS[function]
+    if function == "ldap_query":
+        # the fake is only installed for the function that binds to ldap
+        import fake_ldap  # pylint: disable=import-outside-toplevel
+
+        fake_ldap.install(fake_ldap.FakeDirectory(0))
+    start = time.perf_counter()
+    module = benchmark_utils.load_lambda(
+        os.path.join(benchmark_utils.MODULES_DIR, path), function, ENVIRONMENT
+    )
+    init = time.perf_counter() - start
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    first_response = None
+    if event is not None:
+        start = time.perf_counter()
+        module.handler(event, None)
+        first_response = time.perf_counter() - start
+    print(
+        json.dumps({"init": init, "first_response": first_response, "loaded": loaded})
+    )
+
+
+def main():
+    """Initializes each function in its own process, repeat times."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--functions", nargs="+", choices=FUNCTIONS, default=list(FUNCTIONS)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--run-function", choices=FUNCTIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_function:
+        run_function(args.run_function)
+        return
+
+    header = (
+        f"{'function':<20}{'init (ms)':>12}{'first response (ms)':>22}"
+        f"  heavy modules loaded"
+    )
+    print(header)
+    print("-" * len(header))
+    for function in args.functions:
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, __file__, "--run-function", function],
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        init = statistics.median(result["init"] for result in results) * 1000
+        first_response = "n/a"
+        if results[0]["first_response"] is not None:
+            first_response = (
+                f"{statistics.median(r['first_response'] for r in results) * 1000:.1f}"
+            )
+        loaded = ", ".join(results[0]["loaded"]) or "none"
+        print(f"{function:<20}{init:>12.1f}{first_response:>22}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
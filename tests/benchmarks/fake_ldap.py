@@ -0,0 +1,364 @@
+# pylint: skip-file
+"""In-process stand-in for the python-ldap module
+
+Serves a deterministic directory of synthetic Active Directory style users
+so the lambda functions can be benchmarked without a directory server.
+Entries are generated on demand from their index, so directories with
+millions of users don't have to be held in memory.
+
+The LDAP filters built by the LDAP Query function are partially evaluated:
+excluded userAccountControl flags (LDAP_MATCHING_RULE_BIT_AND), the
+pwdLastSet cutoff, uSNChanged and sAMAccountName ranges are applied, every
+other clause is ignored.
+"""
+
+import random
+import re
+import string
+import sys
+import threading
+import time
+import types
+
+# January 1, 1970 as MS file time
+EPOCH_AS_FILETIME = 116444736000000000
+FILETIME_TICKS_PER_DAY = 86400 * 10000000
+
+UAC_EXCLUSION = re.compile(
+    r"\(!\(userAccountControl:1\.2\.840\.113556\.1\.4\.803:=(\d+)\)\)"
+)
+PWDLASTSET_CUTOFF = re.compile(r"\(pwdLastSet<=(\d+)\)")
+USN_CHANGED = re.compile(r"\(uSNChanged>=(\d+)\)")
+SAM_LOWER_BOUND = re.compile(r"(?<!!)\(sAMAccountName>=([^)]+)\)")
+SAM_UPPER_BOUND = re.compile(r"\(!\(sAMAccountName>=([^)]+)\)\)")
+TEST_DESCRIPTION = "***TEST***"
+
+
+class FakeDirectory:
+    """A directory of synthetic users, generated from their index."""
+
+    def __init__(
+        self, size, seed=0, domain_base="DC=example,DC=com", latency=0, busy_rate=0
+    ):
+        self.size = size
+        self.seed = seed
+        self.domain_base = domain_base
+        # seconds the server takes to return each page
+        self.latency = latency
+        # fraction of the search and modify requests answered with BUSY
+        self.busy_rate = busy_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.now_filetime = EPOCH_AS_FILETIME + int(time.time()) * 10000000
+        self.entries_returned = 0
+        self.modified = 0
+        self.added = 0
+
+    def is_busy(self):
+        """Returns True if the next request should be pushed back."""
+        if not self.busy_rate:
+            return False
+        with self.lock:
+            return self.rng.random() < self.busy_rate
+
+    def mix(self, index):
+        """Cheap deterministic pseudo random number for an entry."""
+        return ((index + 1) * 2654435761 + self.seed * 40503) % 4294967296
+
+    def account_state(self, index):
+        """Returns the userAccountControl, pwdLastSet and description."""
+        x = self.mix(index)
+        if x % 100 < 3:
+            uac = 514  # disabled
+        elif x % 100 < 5:
+            uac = 66048  # password doesn't expire
+        else:
+            uac = 512
+
+        if x % 1000 < 50:
+            pwdlastset = 0  # never set
+        elif x % 10 < 9:
+            pwdlastset = self.now_filetime - (x % 90) * FILETIME_TICKS_PER_DAY
+        else:
+            pwdlastset = self.now_filetime - (x % 730) * FILETIME_TICKS_PER_DAY
+
+        description = TEST_DESCRIPTION if x % 1000 == 999 else "Synthetic user"
+        return uac, pwdlastset, description
+
+    def name(self, index):
+        """Returns the sAMAccountName, spread over the letters of the alphabet."""
+        letter = string.ascii_lowercase[self.mix(index) // 7 % 26]
+        return f"{letter}user{index:07d}"
+
+    def user(self, index):
+        """Returns the dn and attributes of the user at the provided index."""
+        uac, pwdlastset, description = self.account_state(index)
+        name = self.name(index)
+        dn = f"CN={name},OU=Users,{self.domain_base}"
+        return dn, {
+            "objectClass": [b"top", b"person", b"organizationalPerson", b"user"],
+            "cn": [name.encode()],
+            "sn": [b"User"],
+            "givenName": [name.encode()],
+            "displayName": [f"Synthetic User {index}".encode()],
+            "description": [description.encode()],
+            "distinguishedName": [dn.encode()],
+            "mail": [f"{name}@example.com".encode()],
+            "memberOf": [f"CN=Domain Users,CN=Users,{self.domain_base}".encode()],
+            "objectCategory": [
+                f"CN=Person,CN=Schema,CN=Configuration,{self.domain_base}".encode()
+            ],
+            "objectGUID": [index.to_bytes(16, "big")],
+            "pwdLastSet": [str(pwdlastset).encode()],
+            "sAMAccountName": [name.encode()],
+            "uSNChanged": [str(index + 1).encode()],
+            "userAccountControl": [str(uac).encode()],
+            "whenCreated": [b"20200101000000.0Z"],
+        }
+
+    def compile_filter(self, filter_string):
+        """Returns a predicate applying the supported clauses of the filter."""
+        filter_string = filter_string or ""
+        mask = 0
+        for flag in UAC_EXCLUSION.findall(filter_string):
+            mask |= int(flag)
+        usn = USN_CHANGED.search(filter_string)
+        min_usn = int(usn.group(1)) if usn else 0
+        cutoff = PWDLASTSET_CUTOFF.search(filter_string)
+        cutoff = int(cutoff.group(1)) if cutoff else None
+        lower = SAM_LOWER_BOUND.search(filter_string)
+        lower = lower.group(1) if lower else None
+        upper = SAM_UPPER_BOUND.search(filter_string)
+        upper = upper.group(1) if upper else None
+
+        def matches(index):
+            uac, pwdlastset, description = self.account_state(index)
+            if uac & mask or index + 1 < min_usn:
+                return False
+            if lower is not None or upper is not None:
+                name = self.name(index)
+                if lower is not None and name < lower:
+                    return False
+                if upper is not None and name >= upper:
+                    return False
+            if cutoff is not None:
+                stale = 1 <= pwdlastset <= cutoff
+                return stale or description == TEST_DESCRIPTION
+            return True
+
+        return matches
+
+    def search(self, start, size, filter_string, attrlist):
+        """
+        Returns up to size matching entries from index start along with the
+        index to resume from, or None once the directory is exhausted.
+        """
+        matches = self.compile_filter(filter_string)
+        page = []
+        index = start
+        while index < self.size and len(page) < size:
+            index += 1
+            if not matches(index - 1):
+                continue
+            dn, attributes = self.user(index - 1)
+            if attrlist:
+                attributes = {
+                    key: value for key, value in attributes.items() if key in attrlist
+                }
+            page.append((dn, attributes))
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.entries_returned += len(page)
+        return page, (index if index < self.size else None)
+
+
+class LDAPError(Exception):
+    pass
+
+
+ERRORS = [
+    "ADMINLIMIT_EXCEEDED",
+    "ALREADY_EXISTS",
+    "BUSY",
+    "CONNECT_ERROR",
+    "INVALID_CREDENTIALS",
+    "NO_SUCH_OBJECT",
+    "OTHER",
+    "SERVER_DOWN",
+    "SIZELIMIT_EXCEEDED",
+    "TIMELIMIT_EXCEEDED",
+    "TIMEOUT",
+    "UNAVAILABLE",
+    "UNWILLING_TO_PERFORM",
+]
+ERROR_TYPES = {name: type(name, (LDAPError,), {}) for name in ERRORS}
+
+
+class SimplePagedResultsControl:
+    controlType = "1.2.840.113556.1.4.319"
+
+    def __init__(self, criticality=True, size=10, cookie=""):
+        self.criticality = criticality
+        self.size = size
+        self.cookie = cookie
+
+
+class LDAPControl:
+    def __init__(self, controlType=None, criticality=False, encodedControlValue=None):
+        self.controlType = controlType
+        self.criticality = criticality
+        self.encodedControlValue = encodedControlValue
+
+
+class FakeLDAPObject:
+    """Connection to a FakeDirectory, results are available immediately."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.msgid = 0
+        self.results = {}
+
+    def set_option(self, option, value):
+        pass
+
+    def bind_s(self, who, cred):
+        pass
+
+    def unbind_s(self):
+        pass
+
+    unbind = unbind_s
+
+    def queue(self, result):
+        self.msgid += 1
+        self.results[self.msgid] = result
+        return self.msgid
+
+    def search_ext(
+        self,
+        base,
+        scope,
+        filterstr=None,
+        attrlist=None,
+        attrsonly=0,
+        serverctrls=None,
+        clientctrls=None,
+        timeout=-1,
+        sizelimit=0,
+    ):
+        if scope == SCOPE_BASE:
+            usn = str(self.directory.size).encode()
+            entry = {"dsServiceName": [b"CN=NTDS Settings,CN=DC1"]}
+            entry["highestCommittedUSN"] = [usn]
+            return self.queue(([("", entry)], []))
+
+        if self.directory.is_busy():
+            return self.queue(ERROR_TYPES["BUSY"]({"desc": "Server is busy"}))
+        page_control = None
+        for control in serverctrls or []:
+            if control.controlType == SimplePagedResultsControl.controlType:
+                page_control = control
+        start = int(page_control.cookie or 0) if page_control else 0
+        size = page_control.size if page_control else self.directory.size
+        page, next_index = self.directory.search(start, size, filterstr, attrlist)
+        controls = []
+        if page_control:
+            cookie = str(next_index).encode() if next_index is not None else b""
+            controls.append(SimplePagedResultsControl(True, size, cookie))
+        return self.queue((page, controls))
+
+    def search_ext_s(self, *args, **kwargs):
+        return self.result3(self.search_ext(*args, **kwargs))[1]
+
+    def result3(self, msgid=-1, all=1, timeout=None):
+        if msgid == -1:
+            msgid = min(self.results)
+        result = self.results.pop(msgid)
+        if isinstance(result, Exception):
+            raise result
+        data, controls = result
+        return 101, data, msgid, controls
+
+    def modify(self, dn, modlist):
+        if self.directory.is_busy():
+            return self.queue(ERROR_TYPES["BUSY"]({"desc": "Server is busy"}))
+        self.directory.modified += 1
+        return self.queue(([], []))
+
+    modify_ext = modify
+
+    def modify_s(self, dn, modlist):
+        self.result3(self.modify(dn, modlist))
+
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        self.directory.added += 1
+        return self.queue(([], []))
+
+    def add_s(self, dn, modlist):
+        self.result3(self.add_ext(dn, modlist))
+
+
+def escape_filter_chars(assertion_value, escape_mode=0):
+    for char, escaped in (
+        ("\\", r"\5c"),
+        ("*", r"\2a"),
+        ("(", r"\28"),
+        (")", r"\29"),
+        ("\x00", r"\00"),
+    ):
+        assertion_value = assertion_value.replace(char, escaped)
+    return assertion_value
+
+
+def add_modlist(entry, ignore_attr_types=None):
+    return [(key, value) for key, value in entry.items() if value]
+
+
+SCOPE_BASE = 0
+SCOPE_ONELEVEL = 1
+SCOPE_SUBTREE = 2
+
+
+def install(directory):
+    """Registers the fake as the ldap module and its submodules."""
+    ldap = types.ModuleType("ldap")
+    ldap.__dict__.update(
+        {
+            "LDAPError": LDAPError,
+            "SCOPE_BASE": SCOPE_BASE,
+            "SCOPE_ONELEVEL": SCOPE_ONELEVEL,
+            "SCOPE_SUBTREE": SCOPE_SUBTREE,
+            "MOD_ADD": 0,
+            "MOD_DELETE": 1,
+            "MOD_REPLACE": 2,
+            "RES_ANY": -1,
+            "OPT_REFERRALS": 8,
+            "OPT_X_TLS_REQUIRE_CERT": 24582,
+            "OPT_X_TLS_NEVER": 0,
+            "set_option": lambda option, value: None,
+            "initialize": lambda uri, **kwargs: FakeLDAPObject(directory),
+        }
+    )
+    ldap.__dict__.update(ERROR_TYPES)
+
+    controls = types.ModuleType("ldap.controls")
+    controls.SimplePagedResultsControl = SimplePagedResultsControl
+    controls.LDAPControl = LDAPControl
+    ldap_filter = types.ModuleType("ldap.filter")
+    ldap_filter.escape_filter_chars = escape_filter_chars
+    modlist = types.ModuleType("ldap.modlist")
+    modlist.addModlist = add_modlist
+
+    ldap.controls = controls
+    ldap.filter = ldap_filter
+    ldap.modlist = modlist
+    sys.modules.update(
+        {
+            "ldap": ldap,
+            "ldap.controls": controls,
+            "ldap.filter": ldap_filter,
+            "ldap.modlist": modlist,
+        }
+    )
+    return ldap
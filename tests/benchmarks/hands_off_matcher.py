@@ -0,0 +1,95 @@
+"""Micro-benchmark of the ldap_query hands off account check
+
+Compares LdapMaintainer.is_special, backed by the precompiled HandsOffMatcher,
+against the previous implementation that rebuilt the disabled code list and
+ran fnmatch over every hands off pattern for every user.
+
+usage: python hands_off_matcher.py [--users N] [--patterns N]
+"""
+
+import argparse
+import fnmatch
+import random
+import string
+import timeit
+
+import benchmark_utils
+import fake_ldap
+
+
+def legacy_is_special(filter_patterns, sam_name, uac):
+    """The hands off check as it was implemented before HandsOffMatcher."""
+    disabled_codes = [
+        "514",
+        "65536",
+        "66048",
+        "66050",
+        "66080",
+        "262658",
+        "262690",
+    ]
+    return uac in disabled_codes or any(
+        fnmatch.fnmatch(sam_name, pattern) for pattern in filter_patterns
+    )
+
+
+def random_name(rng, length=10):
+    """Returns a random lowercase name."""
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+def generate_patterns(rng, count):
+    """Half exact account names, half glob patterns."""
+    patterns = [random_name(rng) for _ in range(count // 2)]
+    patterns += [f"{random_name(rng, 4)}*" for _ in range(count - len(patterns))]
+    return patterns
+
+
+def generate_users(rng, count):
+    """Returns (sAMAccountName, userAccountControl) pairs, some disabled."""
+    uac_values = ["512", "512", "512", "514", "66048"]
+    return [(random_name(rng), rng.choice(uac_values)) for _ in range(count)]
+
+
+def main():
+    """Times HandsOffMatcher against the fnmatch implementation it replaced."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--patterns", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    patterns = generate_patterns(rng, args.patterns)
+    users = generate_users(rng, args.users)
+
+    fake_ldap.install(fake_ldap.FakeDirectory(0))
+    ldap_query = benchmark_utils.load_ldap_query()
+    build_time = timeit.timeit(lambda: ldap_query.HandsOffMatcher(patterns), number=1)
+    matcher = ldap_query.HandsOffMatcher(patterns)
+    assert [matcher.matches(sam, uac) for sam, uac in users] == [
+        legacy_is_special(patterns, sam, uac) for sam, uac in users
+    ], "HandsOffMatcher and the fnmatch implementation disagree"
+
+    legacy = timeit.timeit(
+        lambda: [legacy_is_special(patterns, sam, uac) for sam, uac in users],
+        number=1,
+    )
+    compiled = min(
+        timeit.repeat(
+            lambda: [matcher.matches(sam, uac) for sam, uac in users],
+            number=1,
+            repeat=5,
+        )
+    )
+
+    print(f"users: {args.users}, hands off patterns: {args.patterns}")
+    print(f"{'implementation':<20}{'total (s)':>12}{'per user (us)':>16}")
+    for name, seconds in (("fnmatch per user", legacy), ("HandsOffMatcher", compiled)):
+        print(f"{name:<20}{seconds:>12.4f}{seconds / args.users * 1e6:>16.2f}")
+    print(f"matcher build time: {build_time * 1e3:.2f} ms")
+    print(f"speedup: {legacy / compiled:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
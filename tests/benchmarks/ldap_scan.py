@@ -0,0 +1,218 @@
+"""LDAP Query scan benchmark
+
+Measures how the phases of an LDAP Query run scale with the size of the
+directory. Each phase runs in its own process against an in-process fake of
+the ldap module seeded with synthetic Active Directory style users, and
+reports the wall time, entries per second and peak RSS. Entries are the
+directory entries returned by the searches (or the stale users written to
+the artifacts), not the size of the directory.
+
+usage: python ldap_scan.py [--sizes 1000 10000 100000 1000000]
+                           [--shards 1 4] [--latency 0.05] [--busy-rate 0.01]
+"""
+
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import time
+
+import benchmark_utils
+import fake_ldap
+
+DAYS_SINCE_PWDLASTSET = 120
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def get_maintainer(ldap_query, page_size, shards=1):
+    """Returns an LdapMaintainer of the benchmark directory."""
+    return ldap_query.LdapMaintainer(
+        ldaps_url="ldaps://benchmark.example.com",
+        domain_base="DC=example,DC=com",
+        svc_user_dn="CN=svc,DC=example,DC=com",
+        svc_user_pwd="benchmark",
+        days_since_pwdlastset=DAYS_SINCE_PWDLASTSET,
+        filter_patterns=["Administrator", "Guest", "krbtgt", "svc_*"],
+        page_size=page_size,
+        scan_shards=shards,
+    )
+
+
+# every phase is called with the same arguments, whether it uses them or not
+# pylint: disable=unused-argument
+
+
+def search_and_decode(ldap_query, maintainer, directory):
+    """LdapMaintainer.search and byte_decode_search_results"""
+    decoded = maintainer.byte_decode_search_results(
+        maintainer.search_sharded(maintainer.get_user_filter())
+    )
+    for _ in decoded:
+        pass
+    return directory.entries_returned
+
+
+def get_stale_users(ldap_query, maintainer, directory):
+    """LdapMaintainer.get_stale_users"""
+    maintainer.get_stale_users()
+    return directory.entries_returned
+
+
+def generate_artifacts(ldap_query, maintainer, directory):
+    """generate_artifacts and their upload, excluding the scan"""
+    batches = list(maintainer.iter_stale_users())
+    user_counts = {f"{threshold}": 0 for threshold in maintainer.thresholds}
+    start = time.perf_counter()
+    ldap_query.upload_all_artifacts(
+        users=ldap_query.count_users(batches, user_counts),
+        user_counts=user_counts,
+        days_since_pwdlastset=str(DAYS_SINCE_PWDLASTSET),
+    )
+    return sum(user_counts.values()), start
+
+
+def query(ldap_query, maintainer, directory):
+    """The streaming query pipeline, from the scan to the uploaded artifacts"""
+    user_counts = {f"{threshold}": 0 for threshold in maintainer.thresholds}
+    ldap_query.upload_all_artifacts(
+        users=ldap_query.count_users(maintainer.iter_stale_users(), user_counts),
+        user_counts=user_counts,
+        days_since_pwdlastset=str(DAYS_SINCE_PWDLASTSET),
+    )
+    return directory.entries_returned
+
+
+def disable(ldap_query, maintainer, directory):
+    """LdapMaintainer.disable_users of every stale user, excluding the scan"""
+    maintainer.users_to_disable = [
+        {"dn": user["dn"]} for batch in maintainer.iter_stale_users() for user in batch
+    ]
+    start = time.perf_counter()
+    results = maintainer.disable_users()
+    return results["disabled"], start
+
+
+# pylint: enable=unused-argument
+
+
+PHASES = {
+    "search_decode": search_and_decode,
+    "get_stale_users": get_stale_users,
+    "generate_artifacts": generate_artifacts,
+    "query": query,
+    "disable": disable,
+}
+
+
+def run_phase(args):
+    """
+    Runs a single phase in the current process and prints its metrics, for
+    the first of the sizes and shards in args.
+    """
+    directory = fake_ldap.FakeDirectory(
+        args.sizes[0], seed=args.seed, latency=args.latency, busy_rate=args.busy_rate
+    )
+    fake_ldap.install(directory)
+    ldap_query = benchmark_utils.load_ldap_query()
+    s3 = benchmark_utils.NullS3()
+    ldap_query.s3 = s3
+    # the fake pushes back instantly, so there's nothing to wait for
+    ldap_query.ldap_retrier.sleep = lambda seconds: None
+    maintainer = get_maintainer(ldap_query, args.page_size, args.shards[0])
+
+    rss_before = benchmark_utils.peak_rss_mib()
+    start = time.perf_counter()
+    result = PHASES[args.run_phase](ldap_query, maintainer, directory)
+    if isinstance(result, tuple):
+        entries, start = result
+    else:
+        entries = result
+    wall = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "phase": args.run_phase,
+                "size": args.sizes[0],
+                "shards": args.shards[0],
+                "entries": entries,
+                "wall": wall,
+                "peak_rss": benchmark_utils.peak_rss_mib(),
+                "rss_growth": benchmark_utils.peak_rss_mib() - rss_before,
+                "bytes_uploaded": s3.bytes_uploaded,
+                "retries": sum(
+                    stats["retries"]
+                    for stats in ldap_query.ldap_retrier.stats.as_dict().values()
+                ),
+            }
+        )
+    )
+
+
+def main():
+    """Runs every phase for each size and shard count in its own process."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--latency", type=float, default=0, help="simulated seconds per page"
+    )
+    parser.add_argument(
+        "--busy-rate",
+        type=float,
+        default=0,
+        help="simulated fraction of requests answered with BUSY",
+    )
+    parser.add_argument("--run-phase", choices=PHASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_phase:
+        run_phase(args)
+        return
+
+    header = (
+        f"{'phase':<20}{'users':>10}{'shards':>8}{'entries':>10}{'wall (s)':>10}"
+        f"{'entries/s':>12}{'peak RSS (MiB)':>16}{'growth (MiB)':>14}"
+        f"{'retries':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for size, phase, shards in itertools.product(args.sizes, args.phases, args.shards):
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--run-phase",
+                phase,
+                "--sizes",
+                str(size),
+                "--page-size",
+                str(args.page_size),
+                "--seed",
+                str(args.seed),
+                "--shards",
+                str(shards),
+                "--latency",
+                str(args.latency),
+                "--busy-rate",
+                str(args.busy_rate),
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        rate = result["entries"] / result["wall"] if result["wall"] else 0
+        print(
+            f"{phase:<20}{size:>10}{shards:>8}{result['entries']:>10}"
+            f"{result['wall']:>10.3f}{rate:>12.0f}"
+            f"{result['peak_rss']:>16.1f}{result['rss_growth']:>14.1f}"
+            f"{result['retries']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ module "test_infrastructure" {
   filter_prefixes              = var.filter_prefixes
   additional_test_users        = var.additional_test_users
   python_ldap_layer_arn        = module.ldap_maintainer.python_ldap_layer_arn
+  common_layer_arn             = module.ldap_maintainer.common_layer_arn
 }
 
 module "ldap_maintainer" {
@@ -236,4 +236,5 @@ module "populate_ldap" {
   test_users            = concat(local.test_users, var.additional_test_users)
   filter_prefixes       = var.filter_prefixes
   python_ldap_layer_arn = var.python_ldap_layer_arn
+  common_layer_arn      = var.common_layer_arn
 }
@@ -1,53 +1,36 @@
 # pylint: skip-file
-import collections
+import argparse
 import fnmatch
 import json
-import logging
 import os
 import random
 from datetime import datetime
-from time import sleep
 
 import ldap
-import ldap.asyncsearch
 import ldap.modlist
+import ldif
+from ldap_maintainer_common.logs import configure_logging
+from ldap_maintainer_common.retry import Retrier
 
-DEFAULT_LOG_LEVEL = logging.DEBUG
-LOG_LEVELS = collections.defaultdict(
-    lambda: DEFAULT_LOG_LEVEL,
-    {
-        "critical": logging.CRITICAL,
-        "error": logging.ERROR,
-        "warning": logging.WARNING,
-        "info": logging.INFO,
-        "debug": logging.DEBUG,
-    },
-)
+log = configure_logging(__name__, "ldap_maintainer.log")
 
-# Lambda initializes a root logger that needs to be removed in order to set a
-# different logging config
-root = logging.getLogger()
-if root.handlers:
-    for handler in root.handlers:
-        root.removeHandler(handler)
-
-log_file_name = ""
-if not os.environ.get("AWS_EXECUTION_ENV"):
-    log_file_name = "ldap_maintainer.log"
-
-logging.basicConfig(
-    filename=log_file_name,
-    format="%(asctime)s.%(msecs)03dZ [%(name)s][%(levelname)-5s]: %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S",
-    level=LOG_LEVELS[os.environ.get("LOG_LEVEL", "").lower()],
-)
-log = logging.getLogger(__name__)
 
+# the connection settings are not needed when writing ldif files locally
+LDAPS_URL = os.environ.get("LDAPS_URL")
+DOMAIN_BASE = os.environ.get("DOMAIN_BASE")
+SVC_USER_DN = os.environ.get("SVC_USER_DN")
+SVC_USER_PWD = os.environ.get("SVC_USER_PWD")
 
-LDAPS_URL = os.environ["LDAPS_URL"]
-DOMAIN_BASE = os.environ["DOMAIN_BASE"]
-SVC_USER_DN = os.environ["SVC_USER_DN"]
-SVC_USER_PWD = os.environ["SVC_USER_PWD"]
+# Maximum number of add requests awaiting a response from the server
+DEFAULT_ADD_WINDOW = 100
+
+# users that were just added may not be visible to the next request yet
+ldap_retrier = Retrier(
+    retryable=(ldap.NO_SUCH_OBJECT, ldap.BUSY, ldap.UNAVAILABLE, ldap.TIMEOUT),
+    reconnect=(ldap.SERVER_DOWN, ldap.CONNECT_ERROR),
+    max_attempts=4,
+    base_delay=2,
+)
 
 
 class LdapMaintainer:
@@ -64,46 +47,69 @@ class LdapMaintainer:
         log.debug("Successfully connected to LDAP server.")
         return con
 
-    def add_users(self, user_list):
-        con = self.connect()
-        user_count = 0
-        log.info("Received input list of %s users", len(user_list))
-        for user_obj in user_list:
+    def add_users(self, user_list, window=DEFAULT_ADD_WINDOW):
+        """Create the users over a single connection.
+
+        Asynchronous add requests are pipelined, with up to `window`
+        requests awaiting a response at any time, fewer while the server
+        pushes back. Adds that fail with a retryable error are sent again
+        after a backoff. Users that already exist are skipped.
+        """
+        counts = {"received": 0, "created": 0}
+
+        def received():
+            for user_obj in user_list:
+                counts["received"] += 1
+                yield user_obj
+
+        def send(user_obj):
+            return self.connection.add_ext(
+                user_obj["dn"], ldap.modlist.addModlist(user_obj["user"])
+            )
+
+        def receive(msgid):
             try:
-                con.add_s(user_obj["dn"], ldap.modlist.addModlist(user_obj["user"]))
-                user_count += 1
+                self.connection.result3(msgid)
             except ldap.ALREADY_EXISTS:
-                continue
-        log.info("Created %s users", user_count)
+                return False
+            return True
 
-    @staticmethod
-    def ldap_retry(func, max_tries=4, sleep_time=2):
-        """ldap retry function with back off timer
-        https://stackoverflow.com/a/33792744/12031185
+        def on_result(user_obj, created, error):
+            if error is not None:
+                raise error
+            if created:
+                counts["created"] += 1
 
-        Arguments:
-            func {function} -- [input python-ldap function]
+        ldap_retrier.pipeline(
+            "add",
+            received(),
+            send,
+            receive,
+            on_result,
+            window,
+            reconnect=self.reconnect,
+        )
+        log.info("Received input list of %s users", counts["received"])
+        log.info("Created %s users", counts["created"])
 
-        Keyword Arguments:
-            max_tries {int} -- [number of retries] (default: {4})
-            sleep_time {int} -- [(sec)time to next execution] (default: {2})
+    def reconnect(self):
+        """Replaces the connection after the server dropped it."""
+        self.connection = self.connect()
+
+    def ldap_retry(self, func, operation="modify"):
+        """Returns the result of the python-ldap function call, retried with
+        a jittered backoff while it fails with a retryable error.
 
-        Returns:
-            [varies] -- [returns the results of the python-ldap function call]
+        func must read self.connection when called, since the connection is
+        replaced when the server drops it.
         """
-        for _ in range(0, max_tries):
-            try:
-                return func()
-            except ldap.NO_SUCH_OBJECT:
-                sleep(sleep_time)
-                sleep_time *= 2
+        return ldap_retrier.call(operation, func, reconnect=self.reconnect)
 
     @staticmethod
     def get_random_users(user_list, user_count):
         return random.sample(user_list, min(len(user_list), user_count))
 
     def disable_random_users(self, user_list, user_count):
-        con = self.connect()
         date = datetime.now().strftime("%Y-%m-%d-T%H%M")
         d = f"***Disabled {date} by ldapmaintbot***"
         # get a random list of users and disable them
@@ -113,18 +119,23 @@ class LdapMaintainer:
             update_description = [
                 (ldap.MOD_REPLACE, "description", [d.encode("utf-8")])
             ]
-            self.ldap_retry(lambda: con.modify_s(user_obj["dn"], disable_user))
-            self.ldap_retry(lambda: con.modify_s(user_obj["dn"], update_description))
+            self.ldap_retry(
+                lambda: self.connection.modify_s(user_obj["dn"], disable_user)
+            )
+            self.ldap_retry(
+                lambda: self.connection.modify_s(user_obj["dn"], update_description)
+            )
 
     def label_random_users(self, user_list, user_count):
-        con = self.connect()
         d = "***TEST***"
         random_list = self.get_random_users(user_list, user_count)
         for user_obj in random_list:
             update_description = [
                 (ldap.MOD_REPLACE, "description", [d.encode("utf-8")])
             ]
-            self.ldap_retry(lambda: con.modify_s(user_obj["dn"], update_description))
+            self.ldap_retry(
+                lambda: self.connection.modify_s(user_obj["dn"], update_description)
+            )
 
 
 def byte_encode_user_map(input_map):
@@ -138,12 +149,11 @@ def byte_encode_user_map(input_map):
     return input_map
 
 
-def generate_user_objects(test_users):
-    user_list = []
+def iter_user_objects(test_users, domain_base=None):
     for user in test_users:
         user_obj = {}
         full_name = f"{user['name']}{user['surname']}".lower()
-        user_obj["dn"] = f"cn={full_name},CN=Users,{DOMAIN_BASE}"
+        user_obj["dn"] = f"cn={full_name},CN=Users,{domain_base or DOMAIN_BASE}"
         user_obj["user"] = byte_encode_user_map(
             {
                 "cn": [full_name],
@@ -161,8 +171,37 @@ def generate_user_objects(test_users):
                 "userAccountControl": ["512"],
             }
         )
-        user_list.append(user_obj)
-    return user_list
+        yield user_obj
+
+
+def generate_user_objects(test_users, domain_base=None):
+    return list(iter_user_objects(test_users, domain_base))
+
+
+def generate_synthetic_users(count, seed=0, names_file="usernames_large.json"):
+    """Yield `count` test users, deterministic for a given seed.
+
+    Names are drawn from the standard users of names_file and made unique by
+    appending the user's index.
+    """
+    names = load_json_file(names_file)["standard"]
+    rng = random.Random(seed)
+    for i in range(count):
+        person = rng.choice(names)
+        yield {
+            "name": person["name"],
+            "surname": f"{person['surname']}{i}",
+            # sAMAccountName is limited to 20 characters
+            "sam": f"{person['name'][:8]}.{i}",
+        }
+
+
+def write_ldif(user_objects, output_file):
+    """Write the user objects as ldif content records for offline loading."""
+    writer = ldif.LDIFWriter(output_file)
+    for user_obj in user_objects:
+        writer.unparse(user_obj["dn"], user_obj["user"])
+    return writer.records_written
 
 
 def load_json_file(file_name):
@@ -185,3 +224,34 @@ def handler(event, context):
     ldap_maint.disable_random_users(standard_users, 5)
     # label a random 20 users for processing by the ldap maintainer lambda
     ldap_maint.label_random_users(standard_users, 20)
+    # optionally load additional synthetic users for load testing
+    if event and event.get("synthetic_users"):
+        ldap_maint.add_users(
+            iter_user_objects(
+                generate_synthetic_users(
+                    int(event["synthetic_users"]), int(event.get("seed", 0))
+                )
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write synthetic test users to an ldif file for bulk loading"
+    )
+    parser.add_argument("output", help="path of the ldif file to write")
+    parser.add_argument("--domain-base", required=True, help="e.g. DC=example,DC=com")
+    parser.add_argument("--count", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    users = iter_user_objects(
+        generate_synthetic_users(args.count, args.seed), args.domain_base
+    )
+    with open(args.output, "w") as output_file:
+        records = write_ldif(users, output_file)
+    print(f"Wrote {records} users to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -57,5 +57,5 @@ module "lambda" {
     security_group_ids = [aws_security_group.lambda.id]
   }
 
-  layers = [var.python_ldap_layer_arn]
+  layers = [var.python_ldap_layer_arn, var.common_layer_arn]
 }
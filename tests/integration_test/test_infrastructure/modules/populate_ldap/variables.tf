@@ -29,6 +29,11 @@ variable "vpc_id" {
   type        = string
 }
 
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
+
 variable "python_ldap_layer_arn" {
   description = "ARN of the python-ldap layer"
   type        = string
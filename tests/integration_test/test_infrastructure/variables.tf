@@ -30,6 +30,11 @@ variable "target_zone_name" {
   description = "Name of the zone in which to create the simplead DNS record"
 }
 
+variable "common_layer_arn" {
+  description = "ARN of the layer containing the modules shared by the lambda functions"
+  type        = string
+}
+
 variable "python_ldap_layer_arn" {
   description = "ARN of the python-ldap layer"
   type        = string
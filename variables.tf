@@ -102,3 +102,45 @@ variable "manual_approval_timeout" {
   type        = number
   default     = 3600
 }
+
+variable "search_page_size" {
+  description = "Number of entries requested per page when searching the directory with the simple paged results control"
+  type        = number
+  default     = 1000
+}
+
+variable "enable_deferred_slack_commands" {
+  description = "Acknowledge slack bot commands immediately and run them in an asynchronous invocation of the slack bot function, which posts the result back to slack"
+  type        = bool
+  default     = true
+}
+
+variable "enable_incremental_scan" {
+  description = "Only read the directory entries that changed since the previous query, using uSNChanged high-water marks stored in the artifacts bucket"
+  type        = bool
+  default     = false
+}
+
+variable "modify_window" {
+  description = "Maximum number of asynchronous modify requests kept outstanding while disabling users"
+  type        = number
+  default     = 50
+}
+
+variable "search_bases" {
+  description = "Distinguished names of the OUs searched concurrently, on separate connections, instead of domain_base_dn. The OUs must not be nested."
+  type        = list(string)
+  default     = []
+}
+
+variable "scan_shards" {
+  description = "Number of sAMAccountName ranges each search base is split into and searched concurrently, on separate connections"
+  type        = number
+  default     = 1
+}
+
+variable "report_thresholds" {
+  description = "Additional numbers of days since the pwdLastSet ldap attribute has been updated that users are grouped by in the scan results. Only the users of days_since_pwdlastset and greater thresholds are disabled."
+  type        = list(number)
+  default     = []
+}